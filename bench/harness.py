@@ -0,0 +1,393 @@
+"""Offline stand-ins for the Nighty host and the Discord client.
+
+main.py expects Nighty to inject ``bot``, ``Tab``, ``UI``, ``getScriptsPath``,
+``nightyScript`` and a ``print`` that accepts ``type_=``. This module supplies
+fakes for all of them plus fake guilds, channels and emojis, so the script can
+be driven end to end without an account or the Nighty app.
+
+If discord.py is not installed a minimal ``discord`` module exposing the
+exception types the script catches is registered in its place.
+"""
+import asyncio
+import gc
+import random
+import sys
+import time
+import types
+from pathlib import Path
+
+SCRIPT_PATH = Path(__file__).resolve().parent.parent / "main.py"
+
+
+def install_discord():
+    try:
+        import discord
+        return discord
+    except ImportError:
+        pass
+
+    class HTTPException(Exception):
+        def __init__(self, response, message):
+            self.response = response
+            self.status = response.status
+            if isinstance(message, dict):
+                self.code = message.get("code", 0)
+                self.text = message.get("message", "")
+            else:
+                self.code = 0
+                self.text = message or ""
+            super().__init__(f"{self.status} {response.reason} (error code: {self.code}): {self.text}")
+
+    class Forbidden(HTTPException):
+        pass
+
+    class NotFound(HTTPException):
+        pass
+
+    errors = types.ModuleType("discord.errors")
+    errors.HTTPException = HTTPException
+    errors.Forbidden = Forbidden
+    errors.NotFound = NotFound
+
+    discord = types.ModuleType("discord")
+    discord.errors = errors
+    discord.HTTPException = HTTPException
+    discord.Forbidden = Forbidden
+    discord.NotFound = NotFound
+
+    sys.modules["discord"] = discord
+    sys.modules["discord.errors"] = errors
+    return discord
+
+
+discord = install_discord()
+
+
+class FakeResponse:
+    def __init__(self, status, reason, headers=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+def make_forbidden():
+    return discord.errors.Forbidden(FakeResponse(403, "Forbidden"), {"code": 50013, "message": "Missing Permissions"})
+
+
+def make_rate_limited(retry_after, is_global=False):
+    headers = {"Retry-After": str(retry_after), "X-RateLimit-Global": "true" if is_global else "false"}
+    err = discord.errors.HTTPException(FakeResponse(429, "Too Many Requests", headers), {"code": 20016, "message": "Slowmode rate limit"})
+    err.retry_after = retry_after
+    return err
+
+
+def make_http_error(status=500):
+    return discord.errors.HTTPException(FakeResponse(status, "Server Error"), {"code": 0, "message": "Internal Server Error"})
+
+
+# Discord fakes
+
+class FakeEmoji:
+    def __init__(self, emoji_id, name, animated=False):
+        self.id = emoji_id
+        self.name = name
+        self.animated = animated
+
+
+class FakePermissions:
+    def __init__(self, send_messages=True, use_external_emojis=True):
+        self.send_messages = send_messages
+        self.use_external_emojis = use_external_emojis
+
+
+class FakeMember:
+    def __init__(self, member_id):
+        self.id = member_id
+
+
+class FakeTextChannel:
+    """Text channel whose ``send`` sleeps for the configured latency and can
+    replay a script of outcomes: "ok", "forbidden", "http" or "429:<seconds>"."""
+
+    def __init__(self, host, channel_id, name, guild, slowmode_delay=0, script=None):
+        self.host = host
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.slowmode_delay = slowmode_delay
+        self.script = list(script or [])
+        self.permissions = FakePermissions()
+        self.sent = []
+
+    def permissions_for(self, member):
+        return self.permissions
+
+    def next_outcome(self):
+        if self.script:
+            return self.script.pop(0)
+        cfg = self.host.config
+        roll = self.host.rng.random()
+        if roll < cfg.forbidden_ratio:
+            return "forbidden"
+        if roll < cfg.forbidden_ratio + cfg.rate_limit_ratio:
+            return f"429:{cfg.retry_after}"
+        return "ok"
+
+    async def send(self, content):
+        self.host.stats["send_calls"] += 1
+        started = time.perf_counter()
+        if self.host.config.send_latency:
+            await asyncio.sleep(self.host.config.send_latency)
+
+        outcome = self.next_outcome()
+        self.host.stats["send_seconds"] += time.perf_counter() - started
+        if outcome == "forbidden":
+            self.host.stats["forbidden"] += 1
+            raise make_forbidden()
+        if outcome == "http":
+            self.host.stats["http_errors"] += 1
+            raise make_http_error()
+        if outcome.startswith("429"):
+            self.host.stats["rate_limited"] += 1
+            raise make_rate_limited(float(outcome.split(":", 1)[1]))
+
+        self.host.stats["sent"] += 1
+        self.sent.append(content)
+        return types.SimpleNamespace(id=len(self.sent), content=content, channel=self)
+
+
+# The script's channel events only act on discord.TextChannel instances.
+if not hasattr(discord, "TextChannel"):
+    discord.TextChannel = FakeTextChannel
+
+
+class FakeGuild:
+    def __init__(self, guild_id, name, emojis, me):
+        self.id = guild_id
+        self.name = name
+        self.emojis = tuple(emojis)
+        self.icon = None
+        self.me = me
+        self.text_channels = []
+
+    def get_channel(self, channel_id):
+        for ch in self.text_channels:
+            if ch.id == channel_id:
+                return ch
+        return None
+
+
+class FakeBot:
+    def __init__(self):
+        self.guilds = []
+        self.loop = None
+        self.user = FakeMember(1)
+        self.listeners = {}
+        self.guild_index = {}
+        self.channel_index = {}
+
+    def add_guild(self, guild):
+        self.guilds.append(guild)
+        self.guild_index[guild.id] = guild
+        for ch in guild.text_channels:
+            self.channel_index[ch.id] = ch
+
+    def remove_guild(self, guild):
+        self.guilds.remove(guild)
+        self.guild_index.pop(guild.id, None)
+        for ch in guild.text_channels:
+            self.channel_index.pop(ch.id, None)
+
+    def get_guild(self, guild_id):
+        return self.guild_index.get(guild_id)
+
+    def get_channel(self, channel_id):
+        return self.channel_index.get(channel_id)
+
+    def listen(self, name=None):
+        def decorator(func):
+            self.listeners.setdefault(name or func.__name__, []).append(func)
+            return func
+        return decorator
+
+    async def dispatch(self, event, *args):
+        for func in self.listeners.get(event, []):
+            await func(*args)
+
+
+# Nighty UI fakes
+
+class FakeWidget:
+    def __init__(self, host, kind=None, **options):
+        self.host = host
+        self.kind = kind
+        self.options = options
+        self.label = options.get("label")
+        self.value = options.get("value", "")
+        self.checked = options.get("checked", False)
+        self.disabled = options.get("disabled", False)
+        self.loading = False
+        self.rows = list(options.get("rows", []))
+        self.onClick = None
+        self.onInput = None
+        self.onChange = None
+        self.calls = {"insert_rows": 0, "update_rows": 0, "delete_rows": 0}
+
+    def create_container(self, **options):
+        return FakeWidget(self.host, "container", **options)
+
+    def create_card(self, **options):
+        return FakeWidget(self.host, "card", **options)
+
+    def create_group(self, **options):
+        return FakeWidget(self.host, "group", **options)
+
+    def create_ui_element(self, kind, **options):
+        widget = FakeWidget(self.host, kind, **options)
+        self.host.widgets.append(widget)
+        return widget
+
+    def insert_rows(self, rows):
+        self.calls["insert_rows"] += 1
+        self.rows.extend(rows)
+
+    def update_rows(self, rows):
+        self.calls["update_rows"] += 1
+        by_id = {row["id"]: row for row in rows}
+        self.rows = [by_id.pop(row["id"], row) for row in self.rows]
+
+    def delete_rows(self, ids):
+        self.calls["delete_rows"] += 1
+        ids = set(ids)
+        self.rows = [row for row in self.rows if row["id"] not in ids]
+
+    def render(self):
+        pass
+
+
+class FakeUI:
+    Input = "Input"
+    Button = "Button"
+    Checkbox = "Checkbox"
+    Toggle = "Toggle"
+    Table = "Table"
+    Text = "Text"
+
+
+class HarnessConfig:
+    def __init__(self, guilds=4, channels_per_guild=3, emojis_per_guild=50, send_latency=0.0,
+                 rate_limit_ratio=0.0, forbidden_ratio=0.0, retry_after=5.0, slowmode_delay=0, seed=1):
+        self.guilds = guilds
+        self.channels_per_guild = channels_per_guild
+        self.emojis_per_guild = emojis_per_guild
+        self.send_latency = send_latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.forbidden_ratio = forbidden_ratio
+        self.retry_after = retry_after
+        self.slowmode_delay = slowmode_delay
+        self.seed = seed
+
+
+FRUIT_EMOJI_NAMES = ["dough", "spirit", "t_rex", "rumble", "leopard", "kitsune", "buddha", "phoenix", "control", "venom"]
+
+
+class NightyHost:
+    """Loads main.py against fake Nighty globals and a fake Discord client."""
+
+    def __init__(self, config, scripts_path):
+        self.config = config
+        self.scripts_path = Path(scripts_path)
+        self.rng = random.Random(config.seed)
+        self.bot = FakeBot()
+        self.widgets = []
+        self.log = []
+        self.stats = {"send_calls": 0, "sent": 0, "forbidden": 0, "rate_limited": 0, "http_errors": 0, "send_seconds": 0.0}
+        self.populate()
+
+    def populate(self):
+        next_id = 10 ** 17
+        for g in range(self.config.guilds):
+            emojis = [FakeEmoji(next_id + i, name) for i, name in enumerate(FRUIT_EMOJI_NAMES)]
+            emojis.append(FakeEmoji(next_id + 50, "point_trade"))
+            emojis.append(FakeEmoji(next_id + 51, "or_sign"))
+            for i in range(len(emojis), self.config.emojis_per_guild):
+                emojis.append(FakeEmoji(next_id + 100 + i, f"filler_{g}_{i}"))
+
+            guild = FakeGuild(next_id, f"Guild {g}", emojis, FakeMember(1))
+            for c in range(self.config.channels_per_guild):
+                name = "trading" if c == 0 else f"trade-chat-{c}"
+                guild.text_channels.append(FakeTextChannel(self, next_id + 1000 + c, name, guild, self.config.slowmode_delay))
+            guild.text_channels.append(FakeTextChannel(self, next_id + 900, "general", guild))
+            self.bot.add_guild(guild)
+            next_id += 10 ** 6
+
+    def print(self, *args, type_="INFO", **kwargs):
+        self.log.append((type_, " ".join(str(a) for a in args)))
+
+    def Tab(self, **options):
+        return FakeWidget(self, "tab", **options)
+
+    def globals(self):
+        return {
+            "__name__": "nighty_script",
+            "__file__": str(SCRIPT_PATH),
+            "nightyScript": lambda **meta: (lambda func: func),
+            "getScriptsPath": lambda: str(self.scripts_path),
+            "bot": self.bot,
+            "Tab": self.Tab,
+            "UI": FakeUI,
+            "print": self.print,
+        }
+
+    async def load(self, script_path=SCRIPT_PATH):
+        self.bot.loop = asyncio.get_running_loop()
+        source = Path(script_path).read_text(encoding="utf-8")
+        exec(compile(source, str(script_path), "exec"), self.globals())
+        await asyncio.sleep(0)
+
+    def widget(self, label):
+        for widget in self.widgets:
+            if widget.label == label:
+                return widget
+        raise KeyError(label)
+
+    def table(self, index):
+        return [w for w in self.widgets if w.kind == FakeUI.Table][index]
+
+    def click(self, label):
+        return self.widget(label).onClick()
+
+    def set_input(self, label, value):
+        widget = self.widget(label)
+        widget.value = value
+        if widget.onInput:
+            widget.onInput(value)
+
+    def instances(self, type_name):
+        """Script-internal objects by class name, e.g. "CooldownScheduler"."""
+        return [obj for obj in gc.get_objects() if type(obj).__name__ == type_name]
+
+    async def wait_for_log(self, needle, timeout=60.0, start=0):
+        """Waits for a log line containing ``needle``, or any of several needles."""
+        needles = (needle,) if isinstance(needle, str) else tuple(needle)
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            for _, text in self.log[start:]:
+                if any(n in text for n in needles):
+                    return True
+            await asyncio.sleep(0.01)
+        return False
+
+    async def shutdown(self):
+        """Lets the script's background writes finish, so its scripts directory can be removed."""
+        for writer in self.instances("DebouncedWriter"):
+            while writer.busy():
+                await writer.flush()
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.get_running_loop().shutdown_default_executor()
+        for store in self.instances("SqliteChannelStore"):
+            store.close()
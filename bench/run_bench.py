@@ -0,0 +1,153 @@
+"""End-to-end throughput benchmark for main.py against the offline harness.
+
+    python bench/run_bench.py --sizes 10 1000 10000
+
+For each channel count the script is loaded into a fresh scripts directory and
+driven through its UI: Detect, Add, Save trade, one batch send and a timed run
+of the auto-send loop. Reported per size: wall time per phase, sends per
+second for the batch and the auto loop, and how often the auto loop woke up.
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import HarnessConfig, NightyHost  # noqa: E402
+
+
+def write_settings(scripts_path, settings):
+    data_dir = Path(scripts_path) / "json"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    doc = {"trade_channels": [], "trade_offers": [], "trade_requests": [], "settings": settings}
+    (data_dir / "blox_trader.json").write_text(json.dumps(doc))
+
+
+async def timed(host, action, needles, timeout):
+    start_log = len(host.log)
+    started = time.perf_counter()
+    result = action()
+    if asyncio.iscoroutine(result):
+        await result
+    await host.wait_for_log(needles, timeout=timeout, start=start_log)
+    return time.perf_counter() - started
+
+
+async def bench_size(size, args):
+    per_guild = max(1, min(size, args.channels_per_guild))
+    config = HarnessConfig(
+        guilds=math.ceil(size / per_guild),
+        channels_per_guild=per_guild,
+        emojis_per_guild=args.emojis_per_guild,
+        send_latency=args.latency,
+        rate_limit_ratio=args.rate_limit_ratio,
+        forbidden_ratio=args.forbidden_ratio,
+        retry_after=args.retry_after,
+        slowmode_delay=args.slowmode,
+    )
+
+    with tempfile.TemporaryDirectory() as scripts_path:
+        write_settings(scripts_path, {
+            "send_rate_per_second": args.send_rate,
+            "max_concurrent_sends": args.concurrency,
+        })
+        host = NightyHost(config, scripts_path)
+        phases = {}
+
+        phases["load"] = await timed(host, host.load, ["Loaded"], args.timeout)
+        phases["detect"] = await timed(host, lambda: host.click("Detect"), ["Detection complete", "Detect failed"], args.timeout)
+
+        guild = host.bot.guilds[0]
+        general = next(ch for ch in guild.text_channels if ch.name == "general")
+        host.set_input("Server ID", str(guild.id))
+        host.set_input("Channel IDs", str(general.id))
+        phases["add"] = await timed(host, lambda: host.click("Add"), ["Added channels", "Add failed"], args.timeout)
+
+        host.set_input("Offering", args.offers)
+        host.set_input("Requesting", args.requests)
+        phases["save_trade"] = await timed(host, lambda: host.click("Save"), ["Saved:"], args.timeout)
+
+        sent_before = host.stats["sent"]
+        phases["batch"] = await timed(host, lambda: host.click("Start"), ["Batch complete", "Batch stopped"], args.timeout)
+        batch_sent = host.stats["sent"] - sent_before
+
+        schedulers = host.instances("CooldownScheduler")
+        wakeups = {"count": 0}
+        for scheduler in schedulers:
+            original_wait = scheduler.wait
+
+            async def counted_wait(original_wait=original_wait):
+                await original_wait()
+                wakeups["count"] += 1
+
+            scheduler.wait = counted_wait
+
+        host.widget("Auto Send Mode").checked = True
+        sent_before = host.stats["sent"]
+        started = time.perf_counter()
+        host.click("Start")
+        await asyncio.sleep(args.auto_seconds)
+        host.click("Stop")
+        await asyncio.sleep(0.1)
+        phases["auto_loop"] = time.perf_counter() - started
+        auto_sent = host.stats["sent"] - sent_before
+        await host.shutdown()
+
+        return {
+            "channels": len(host.table(1).rows),
+            "guilds": len(host.bot.guilds),
+            "phases": phases,
+            "batch_sent": batch_sent,
+            "batch_sends_per_second": batch_sent / phases["batch"] if phases["batch"] else 0.0,
+            "auto_sent": auto_sent,
+            "auto_sends_per_second": auto_sent / phases["auto_loop"] if phases["auto_loop"] else 0.0,
+            "auto_wakeups": wakeups["count"],
+            "rate_limited": host.stats["rate_limited"],
+            "forbidden": host.stats["forbidden"],
+            "table_calls": dict(host.table(1).calls),
+        }
+
+
+def print_report(results):
+    for result in results:
+        print(f"== {result['channels']} channels in {result['guilds']} guilds ==")
+        for phase, seconds in result["phases"].items():
+            print(f"  {phase:<12} {seconds * 1000:10.1f} ms")
+        print(f"  batch        {result['batch_sent']} sent, {result['batch_sends_per_second']:.1f} sends/s")
+        print(f"  auto loop    {result['auto_sent']} sent, {result['auto_sends_per_second']:.1f} sends/s, {result['auto_wakeups']} wake-ups")
+        print(f"  responses    {result['rate_limited']} rate limited, {result['forbidden']} forbidden")
+        print(f"  table calls  {result['table_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--channels-per-guild", type=int, default=25)
+    parser.add_argument("--emojis-per-guild", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per fake send")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--forbidden-ratio", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=5.0)
+    parser.add_argument("--slowmode", type=int, default=2, help="slowmode_delay reported by fake channels")
+    parser.add_argument("--send-rate", type=float, default=0.0, help="send_rate_per_second setting, 0 for unpaced")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--auto-seconds", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--offers", default="20 dough, spirit, OR, trex")
+    parser.add_argument("--requests", default="rumble, leopard")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = [asyncio.run(bench_size(size, args)) for size in args.sizes]
+    print_report(results)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,24 @@
 import json
 import asyncio
-import random
+import atexit
+import bisect
+import contextlib
+import copy
+import cProfile
+import hashlib
+import io
+import heapq
+import math
 import re
+import pstats
+import sqlite3
+import string
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 import discord
 
 @nightyScript(
@@ -16,15 +31,82 @@ def blox_fruits_trader():
     BASE_DIR = Path(getScriptsPath()) / "json"
     DATA_FILE = BASE_DIR / "blox_trader.json"
     EMOJI_CACHE_FILE = BASE_DIR / "guild_emojis.json"
+    CHANNEL_DB_FILE = BASE_DIR / "blox_trader.db"
+    METRICS_PROM_FILE = BASE_DIR / "blox_trader_metrics.prom"
+    METRICS_JSON_FILE = BASE_DIR / "blox_trader_metrics.json"
+    EVENT_LOG_FILE = BASE_DIR / "blox_trader_events.jsonl"
+    PROFILE_DIR = BASE_DIR / "profiling"
+    EMOJI_CACHE_FLUSH_INTERVAL = 15
+    DATA_FLUSH_INTERVAL = 1.0
+    # Bump when the stored layout changes so older files go through the migrate path.
+    DATA_SCHEMA_VERSION = 2
+    # Discord's "slowmode rate limit" error code and the longest slowmode it allows.
+    SLOWMODE_ERROR_CODE = 20016
+    MAX_SLOWMODE = 21600
+    # Per error class: (first backoff in seconds, consecutive failures before quarantine).
+    # Each further failure doubles the backoff, up to MAX_BACKOFF.
+    HEALTH_POLICY = {
+        "not_found": (600, 2),
+        "forbidden": (600, 3),
+        # Transient (5xx, network) or the trade's fault rather than the channel's:
+        # back off but never quarantine, so channels resume on their own after an outage.
+        "http_error": (60, None),
+        "exception": (60, None),
+        "too_long": (60, None),
+    }
+    MAX_BACKOFF = 6 * 3600
+    MAX_MESSAGE_LENGTH = 2000
+    HEALTH_STATES = ("healthy", "backoff", "quarantined")
     BASE_DIR.mkdir(parents=True, exist_ok=True)
 
     def make_default_data():
         return {
             "trade_channels": [],
             "trade_offers": [],
-            "trade_requests": []
+            "trade_requests": [],
+            "settings": {}
         }
 
+    # Tunables that can be overridden under "settings" in the data file.
+    DEFAULT_SETTINGS = {
+        # "sqlite" keeps channels in blox_trader.db; trades and settings stay in the JSON file.
+        "storage_backend": "json",
+        "emoji_cache_max_guilds": 250,
+        "emoji_cache_max_entries": 10000,
+        "emoji_miss_ttl": 600,
+        "max_concurrent_sends": 4,
+        "send_rate_per_second": 5.0,
+        "table_refresh_interval": 2.0,
+        # Seconds between metrics file exports; 0 turns the export off.
+        "metrics_export_interval": 30.0,
+        # Recent failures kept in memory; the JSONL file rotates to .1 past max bytes.
+        "event_log_size": 200,
+        "event_log_file": False,
+        "event_log_max_bytes": 1048576,
+        # Profiling mode (also the "Profiling" checkbox). When on, phase timings are
+        # written under json/profiling, the next auto-loop cycle or batch is run under
+        # cProfile, and tracemalloc diffs are taken against the moment it was enabled.
+        "profiling": False,
+        "profiling_cprofile": True,
+        "profiling_tracemalloc": True,
+        # Message layout: {offers}, {requests}, {trade}, {or} and {nl} (newline).
+        # A format spec sets the item separator, e.g. "{offers:, }". Channel ids
+        # override guild ids, which override the default.
+        "message_templates": {
+            "default": "{offers} {trade} {requests}",
+            "guilds": {},
+            "channels": {},
+        },
+        # Channel names are matched lowercased. "guilds" maps a guild id to a
+        # rule set whose keys replace the global ones; "disabled" skips it.
+        "channel_rules": {
+            "include": ["trading", "slow-trading", "fast-trading", "trade-chat", "trades", "trade"],
+            "exclude_prefixes": ["pvb", "sab"],
+            "patterns": [],
+            "guilds": {},
+        },
+    }
+
     FRUIT_ALIASES = {
         "leopard": ["tiger"], "rumble": ["lightning"], "spirit": ["soul"],
         "t-rex": ["trex", "rex"], "control": ["kage"], "dough": ["doughnut"],
@@ -34,10 +116,13 @@ def blox_fruits_trader():
 
     TOKEN_PATTERN = re.compile(r'<a?:[^:]+:\d+>|:[^:\s]+:|[^,\s]+')
     LITERAL_EMOJI_PATTERN = re.compile(r'^<a?:[^:]+:\d+>$')
+    CUSTOM_EMOJI_ID_PATTERN = re.compile(r'<a?:[^:]+:(\d+)>')
     COLON_EMOJI_PATTERN = re.compile(r'^:[^:\s]+:$')
     COMPOUND_SPLIT_PATTERN = re.compile(r'([~])')
     SEPARATOR_TOKENS = {"~"}
     SIMPLE_WORD_PATTERN = re.compile(r'^[A-Za-z]+$')
+    EMOJI_NAME_STRIP_PATTERN = re.compile(r'[^a-z0-9]+')
+    EMOJI_INDEX_GRAM = 3
 
     def singularize_token(token):
         if not token:
@@ -65,7 +150,14 @@ def blox_fruits_trader():
             return base.capitalize()
         return base
 
+    def append_run(runs, item, count=1):
+        if runs and runs[-1][0] == item:
+            runs[-1] = (item, runs[-1][1] + count)
+        else:
+            runs.append((item, count))
+
     def parse_trade_input(raw):
+        """Parses "20 dough, spirit" into [("dough", 20), ("spirit", 1)]."""
         if not raw:
             return []
 
@@ -73,7 +165,7 @@ def blox_fruits_trader():
         if not tokens:
             return []
 
-        expanded = []
+        runs = []
         i = 0
         while i < len(tokens):
             token = tokens[i]
@@ -89,37 +181,350 @@ def blox_fruits_trader():
                     if next_token not in SEPARATOR_TOKENS:
                         base_token = singularize_token(next_token)
                         if base_token and base_token not in SEPARATOR_TOKENS and not base_token.isdigit():
-                            expanded.extend([base_token] * count)
+                            append_run(runs, base_token, count)
                             i += 2
                             continue
 
-            expanded.append(token)
+            append_run(runs, token)
             i += 1
 
-        return expanded
+        return runs
 
     def normalize_trade_entries(values):
+        """Accepts [item, count] runs as well as legacy one-string-per-copy lists."""
         if not isinstance(values, list):
             return []
 
-        normalized = []
+        runs = []
         for value in values:
             if isinstance(value, str):
-                normalized.extend(parse_trade_input(value))
-            elif value is not None:
-                normalized.append(str(value))
+                for item, count in parse_trade_input(value):
+                    append_run(runs, item, count)
+            elif isinstance(value, (list, tuple)) and len(value) == 2:
+                item, count = value
+                try:
+                    count = int(count)
+                except:
+                    continue
+                if item is not None and str(item) and count > 0:
+                    append_run(runs, str(item), count)
+            elif value is not None and str(value):
+                append_run(runs, str(value))
+
+        return runs
+
+    TEMPLATE_FIELDS = {"offers", "requests", "trade", "or", "nl"}
+    DEFAULT_TEMPLATE = "{offers} {trade} {requests}"
+
+    def compile_template(text):
+        """Parses a message template once into (field, separator) / (None, literal) steps."""
+        plan = []
+        for literal, field, spec, _ in string.Formatter().parse(text):
+            if literal:
+                plan.append((None, literal))
+            if field is None:
+                continue
+            if field not in TEMPLATE_FIELDS:
+                raise ValueError(f"unknown placeholder {{{field}}}")
+            plan.append((field, spec or " "))
+        if not any(field in ("offers", "requests") for field, _ in plan):
+            raise ValueError("template needs {offers} or {requests}")
+        return tuple(plan)
 
-        return [v for v in normalized if v]
+    def format_trade_runs(runs):
+        return " ".join(f"{count} {item}" if count > 1 else item for item, count in runs)
 
     def looks_like_literal_emoji(token):
         return bool(LITERAL_EMOJI_PATTERN.match(token) or COLON_EMOJI_PATTERN.match(token))
 
+    def normalize_emoji_name(name):
+        return EMOJI_NAME_STRIP_PATTERN.sub("", name.lower())
+
+    def format_emoji(e):
+        return f"<a:{e.name}:{e.id}>" if e.animated else f"<:{e.name}:{e.id}>"
+
+    class GuildEmojiIndex:
+        """Emoji name lookup for one guild's emoji set, indexed by 1..3 character grams."""
+
+        def __init__(self, emojis):
+            self.source = emojis
+            self.names = []
+            self.segments = []
+            self.formatted = []
+            self.exact = {}
+            self.grams = {}
+
+            for e in emojis:
+                i = len(self.names)
+                name = normalize_emoji_name(e.name)
+                self.names.append(name)
+                self.segments.append(frozenset(EMOJI_NAME_STRIP_PATTERN.split(e.name.lower())))
+                self.formatted.append(format_emoji(e))
+                self.exact.setdefault(name, i)
+
+                grams = set()
+                for size in range(1, EMOJI_INDEX_GRAM + 1):
+                    for k in range(len(name) - size + 1):
+                        grams.add(name[k:k + size])
+                for gram in grams:
+                    self.grams.setdefault(gram, set()).add(i)
+
+        def find(self, term):
+            name = normalize_emoji_name(term)
+            if not name:
+                return None
+
+            i = self.exact.get(name)
+            if i is not None:
+                return self.formatted[i]
+
+            size = min(len(name), EMOJI_INDEX_GRAM)
+            query = {name[k:k + size] for k in range(len(name) - size + 1)}
+            postings = []
+            for gram in query:
+                posting = self.grams.get(gram)
+                if not posting:
+                    return None
+                postings.append(posting)
+            postings.sort(key=len)
+
+            candidates = postings[0]
+            for posting in postings[1:]:
+                candidates = candidates & posting
+                if not candidates:
+                    return None
+
+            # Prefer a whole "_"-separated segment, then a prefix, then the tightest fit.
+            best = None
+            for i in candidates:
+                candidate = self.names[i]
+                pos = candidate.find(name)
+                if pos < 0:
+                    continue
+                if name in self.segments[i]:
+                    tier = 0
+                elif pos == 0:
+                    tier = 1
+                else:
+                    tier = 2
+                rank = (tier, len(candidate) - len(name), i)
+                if best is None or rank < best:
+                    best = rank
+
+            return self.formatted[best[2]] if best else None
+
+        def lookup(self, term):
+            found = self.find(term)
+            if found:
+                return found
+            for alias in FRUIT_ALIASES.get(term, ()):
+                found = self.find(alias)
+                if found:
+                    return found
+            return None
+
+    class PhaseTimer:
+        __slots__ = ("stats", "started")
+
+        def __init__(self, stats):
+            self.stats = stats
+
+        def __enter__(self):
+            self.started = time.perf_counter()
+
+        def __exit__(self, *exc):
+            elapsed = time.perf_counter() - self.started
+            stats = self.stats
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+            return False
+
+    class Profiler:
+        """Opt-in phase timers, cProfile captures and tracemalloc diffs, written under PROFILE_DIR."""
+
+        NULL = contextlib.nullcontext()
+
+        def __init__(self):
+            self.enabled = False
+            self.phases = {}
+            self.capture_pending = False
+            self.capturing = False
+            self.baseline = None
+            self.started_tracemalloc = False
+
+        def configure(self, settings):
+            # Reads settings directly: called from DataStore.get() while it loads.
+            enabled = bool(settings.get("profiling", DEFAULT_SETTINGS["profiling"]))
+            if enabled != self.enabled:
+                self.set_enabled(enabled, settings)
+
+        def set_enabled(self, enabled, settings=None):
+            settings = settings if settings is not None else store.get()["settings"]
+            if enabled and not self.enabled:
+                self.enabled = True
+                self.phases = {}
+                self.capture_pending = bool(settings.get("profiling_cprofile", DEFAULT_SETTINGS["profiling_cprofile"]))
+                if settings.get("profiling_tracemalloc", DEFAULT_SETTINGS["profiling_tracemalloc"]):
+                    if not tracemalloc.is_tracing():
+                        tracemalloc.start()
+                        self.started_tracemalloc = True
+                    self.baseline = tracemalloc.take_snapshot()
+                print(f"Profiling on, writing to {PROFILE_DIR}", type_="INFO")
+            elif not enabled and self.enabled:
+                self.report()
+                self.enabled = False
+                self.capture_pending = False
+                self.baseline = None
+                if self.started_tracemalloc:
+                    tracemalloc.stop()
+                    self.started_tracemalloc = False
+                print("Profiling off", type_="INFO")
+
+        def phase(self, name):
+            if not self.enabled:
+                return self.NULL
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = [0, 0.0, 0.0]
+            return PhaseTimer(stats)
+
+        @contextlib.contextmanager
+        def cycle(self, label):
+            """Runs one auto-loop cycle or batch under cProfile if a capture is pending."""
+            if not self.enabled or not self.capture_pending or self.capturing:
+                yield
+                return
+
+            self.capture_pending = False
+            self.capturing = True
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                self.capturing = False
+                self.write_cprofile(label, prof)
+                self.report()
+
+        def write_cprofile(self, label, prof):
+            try:
+                PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                stem = PROFILE_DIR / f"{label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+                prof.dump_stats(str(stem.with_suffix(".prof")))
+                out = io.StringIO()
+                pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(40)
+                stem.with_suffix(".txt").write_text(out.getvalue())
+                print(f"Saved cProfile of {label} to {stem.name}.prof", type_="INFO")
+            except Exception as e:
+                print(f"Profile write failed: {e}", type_="WARNING")
+
+        def report(self):
+            if not self.enabled:
+                return
+            try:
+                PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                phases = {
+                    name: {"calls": n, "total_s": total, "mean_ms": total / n * 1000 if n else 0.0, "max_ms": peak * 1000}
+                    for name, (n, total, peak) in sorted(self.phases.items(), key=lambda item: -item[1][1])
+                }
+                write_text_atomic(PROFILE_DIR / "phases.json", json.dumps(
+                    {"generated_at": datetime.now().isoformat(), "phases": phases}, indent=2))
+
+                if self.baseline is not None and tracemalloc.is_tracing():
+                    snapshot = tracemalloc.take_snapshot()
+                    current, peak = tracemalloc.get_traced_memory()
+                    lines = [f"traced: {current / 1024:.1f} KiB current, {peak / 1024:.1f} KiB peak", ""]
+                    lines.extend(str(stat) for stat in snapshot.compare_to(self.baseline, "lineno")[:30])
+                    write_text_atomic(PROFILE_DIR / "tracemalloc.txt", "\n".join(lines) + "\n")
+            except Exception as e:
+                print(f"Profile report failed: {e}", type_="WARNING")
+
+    profiler = Profiler()
+
     class AutoState:
         running = False
         batch_running = False
         task = None
         should_stop = False
 
+    class CooldownScheduler:
+        """Min-heap of channel ids keyed on their next eligible send time (monotonic)."""
+
+        def __init__(self):
+            self.heap = []
+            self.deadlines = {}
+            self.counter = 0
+            self.wake = asyncio.Event()
+
+        def reset(self, channels):
+            self.heap = []
+            self.deadlines = {}
+            for channel in channels:
+                if channel.health == "quarantined":
+                    continue
+                self.counter += 1
+                key = (channel.deadline(), self.counter)
+                self.deadlines[channel.id] = key
+                self.heap.append((key[0], key[1], channel.id))
+            heapq.heapify(self.heap)
+            self.wake.set()
+
+        def schedule(self, cid, deadline):
+            head = self.peek()
+            self.counter += 1
+            self.deadlines[cid] = (deadline, self.counter)
+            heapq.heappush(self.heap, (deadline, self.counter, cid))
+            if head is None or deadline < head:
+                self.wake.set()
+
+        def track(self, channel):
+            if channel.health == "quarantined":
+                self.discard(channel.id)
+            elif AutoState.running:
+                self.schedule(channel.id, channel.deadline())
+
+        def discard(self, cid):
+            self.deadlines.pop(cid, None)
+
+        def peek(self):
+            # Entries are invalidated lazily: a re-keyed or discarded id leaves its old tuple behind.
+            while self.heap:
+                deadline, seq, cid = self.heap[0]
+                if self.deadlines.get(cid) == (deadline, seq):
+                    return deadline
+                heapq.heappop(self.heap)
+            return None
+
+        def pop_due(self, now):
+            due = []
+            while True:
+                deadline = self.peek()
+                if deadline is None or deadline > now:
+                    break
+                _, _, cid = heapq.heappop(self.heap)
+                del self.deadlines[cid]
+                due.append(cid)
+                metrics.observe("scheduler_lag_seconds", max(0.0, now - deadline))
+            return due
+
+        async def wait(self):
+            self.wake.clear()
+            deadline = self.peek()
+            if deadline is None:
+                await self.wake.wait()
+                return
+
+            delay = deadline - time.monotonic()
+            if delay <= 0:
+                return
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
     def sanitize_trade_channels(raw_channels):
         if not isinstance(raw_channels, list):
             return [], bool(raw_channels)
@@ -172,6 +577,20 @@ def blox_fruits_trader():
             if cooldown < 0:
                 cooldown = 60
 
+            slowmode = entry.get("slowmode")
+            if slowmode is not None:
+                try:
+                    slowmode = max(0, int(slowmode))
+                except (TypeError, ValueError):
+                    slowmode = None
+
+            try:
+                failures = max(0, int(entry.get("failures") or 0))
+            except (TypeError, ValueError):
+                failures = 0
+            health = entry.get("health") if entry.get("health") in HEALTH_STATES else "healthy"
+            last_error = entry.get("last_error") if isinstance(entry.get("last_error"), str) else None
+
             last_sent = entry.get("last_sent") if isinstance(entry.get("last_sent"), str) else None
             cooldown_until = entry.get("cooldown_until") if isinstance(entry.get("cooldown_until"), str) else None
 
@@ -186,9 +605,13 @@ def blox_fruits_trader():
                 "server_icon": server_icon,
                 "channel_name": channel_name,
                 "cooldown": cooldown,
+                "slowmode": slowmode,
                 "last_sent": last_sent,
                 "trade_emoji": trade_emoji,
                 "cooldown_until": cooldown_until,
+                "failures": failures,
+                "health": health,
+                "last_error": last_error,
             }
 
             base_compare = {
@@ -198,9 +621,13 @@ def blox_fruits_trader():
                 "server_icon": entry.get("server_icon"),
                 "channel_name": entry.get("channel_name"),
                 "cooldown": entry.get("cooldown"),
+                "slowmode": entry.get("slowmode"),
                 "last_sent": entry.get("last_sent"),
                 "trade_emoji": entry.get("trade_emoji"),
                 "cooldown_until": entry.get("cooldown_until"),
+                "failures": entry.get("failures"),
+                "health": entry.get("health"),
+                "last_error": entry.get("last_error"),
             }
 
             if any(sanitized_entry[key] != base_compare.get(key) for key in sanitized_entry):
@@ -212,50 +639,653 @@ def blox_fruits_trader():
         cleaned.reverse()
         return cleaned, changed
 
+    def parse_timestamp(value):
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+    def format_timestamp(ts):
+        return datetime.fromtimestamp(ts).isoformat() if ts is not None else None
+
+    class TradeChannel:
+        """One configured channel. Epoch times are kept for display and persistence;
+        readiness uses the monotonic sent_at/blocked_until."""
+
+        __slots__ = ("id", "server_id", "server_name", "server_icon", "channel_name", "cooldown",
+                     "slowmode", "trade_emoji", "last_sent", "cooldown_until", "failures", "health",
+                     "last_error", "sent_at", "blocked_until")
+
+        def __init__(self, cid, server_id, server_name="", server_icon="", channel_name="",
+                     cooldown=60, slowmode=None, trade_emoji=None, last_sent=None, cooldown_until=None,
+                     failures=0, health="healthy", last_error=None):
+            self.id = cid
+            self.server_id = server_id
+            self.server_name = server_name
+            self.server_icon = server_icon
+            self.channel_name = channel_name
+            self.cooldown = cooldown
+            self.slowmode = slowmode
+            self.trade_emoji = trade_emoji
+            self.last_sent = last_sent
+            self.cooldown_until = cooldown_until
+            self.failures = failures
+            self.health = health
+            self.last_error = last_error
+
+            offset = time.monotonic() - time.time()
+            self.sent_at = last_sent + offset if last_sent is not None else None
+            self.blocked_until = cooldown_until + offset if cooldown_until is not None else None
+
+        @classmethod
+        def from_dict(cls, entry):
+            return cls(
+                entry["id"],
+                entry["server_id"],
+                server_name=entry.get("server_name") or "",
+                server_icon=entry.get("server_icon") or "",
+                channel_name=entry.get("channel_name") or "",
+                cooldown=entry.get("cooldown", 60),
+                slowmode=entry.get("slowmode"),
+                trade_emoji=entry.get("trade_emoji"),
+                last_sent=parse_timestamp(entry.get("last_sent")),
+                cooldown_until=parse_timestamp(entry.get("cooldown_until")),
+                failures=entry.get("failures") or 0,
+                health=entry.get("health") or "healthy",
+                last_error=entry.get("last_error"),
+            )
+
+        def to_dict(self):
+            return {
+                "id": self.id,
+                "server_id": self.server_id,
+                "server_name": self.server_name,
+                "server_icon": self.server_icon,
+                "channel_name": self.channel_name,
+                "cooldown": self.cooldown,
+                "slowmode": self.slowmode,
+                "last_sent": format_timestamp(self.last_sent),
+                "trade_emoji": self.trade_emoji,
+                "cooldown_until": format_timestamp(self.cooldown_until),
+                "failures": self.failures,
+                "health": self.health,
+                "last_error": self.last_error,
+            }
+
+        def deadline(self):
+            """Monotonic time at which the channel may be sent to again."""
+            deadline = 0.0
+            if self.sent_at is not None:
+                deadline = self.sent_at + self.cooldown
+            if self.blocked_until is not None and self.blocked_until > deadline:
+                deadline = self.blocked_until
+            return deadline
+
+        def wall_deadline(self):
+            return self.deadline() - time.monotonic() + time.time()
+
+        def remaining(self):
+            return max(0, int(self.deadline() - time.monotonic()))
+
+        def mark_sent(self):
+            self.last_sent = time.time()
+            self.sent_at = time.monotonic()
+            self.cooldown_until = None
+            self.blocked_until = None
+
+        def block_for(self, seconds):
+            self.cooldown_until = time.time() + seconds
+            self.blocked_until = time.monotonic() + seconds
+
+        def record_success(self):
+            self.failures = 0
+            self.health = "healthy"
+            self.last_error = None
+
+        def record_failure(self, error_class):
+            """Backs off or quarantines after a failed send. Returns the backoff, or None when quarantined."""
+            base, limit = HEALTH_POLICY.get(error_class, HEALTH_POLICY["exception"])
+            if error_class != self.last_error:
+                self.failures = 0
+            self.failures += 1
+            self.last_error = error_class
+
+            if limit is not None and self.failures >= limit:
+                self.health = "quarantined"
+                self.cooldown_until = None
+                self.blocked_until = None
+                return None
+
+            delay = min(MAX_BACKOFF, max(self.cooldown, base * 2 ** (self.failures - 1)))
+            self.health = "backoff"
+            self.block_for(delay)
+            return delay
+
+        def recheck(self):
+            """Lets a quarantined channel make one probe send; another failure re-quarantines it."""
+            if self.health != "quarantined":
+                return False
+            self.health = "backoff"
+            self.cooldown_until = None
+            self.blocked_until = None
+            return True
+
+    def serialize_data(data):
+        doc = dict(data)
+        doc["trade_channels"] = [tc.to_dict() for tc in data["trade_channels"]]
+        return doc
+
+    def content_hash(data):
+        canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def load_trusted(raw):
+        """Returns the stored document as-is when it was written by save_data and not edited since."""
+        if not isinstance(raw, dict) or raw.get("schema_version") != DATA_SCHEMA_VERSION:
+            return None
+
+        data = {key: raw.get(key) for key in make_default_data()}
+        if not (
+            isinstance(data["trade_channels"], list)
+            and isinstance(data["trade_offers"], list)
+            and isinstance(data["trade_requests"], list)
+            and isinstance(data["settings"], dict)
+        ):
+            return None
+
+        if raw.get("content_hash") != content_hash(data):
+            return None
+        data["trade_channels"] = [TradeChannel.from_dict(tc) for tc in data["trade_channels"]]
+        data["trade_offers"] = [tuple(run) for run in data["trade_offers"]]
+        data["trade_requests"] = [tuple(run) for run in data["trade_requests"]]
+        return data
+
     def load_data():
-        load_failed = False
         try:
             with open(DATA_FILE, "r") as f:
                 raw = json.load(f)
         except:
             raw = {}
-            load_failed = True
+
+        trusted = load_trusted(raw)
+        if trusted is not None:
+            return trusted
+
+        # Legacy, hand-edited or damaged file: sanitize everything, then write it
+        # back stamped so the next load takes the fast path.
+        if not isinstance(raw, dict):
+            raw = {}
 
         data = make_default_data()
-        changed = load_failed
+        with profiler.phase("sanitize_trade_channels"):
+            sanitized_channels, _ = sanitize_trade_channels(raw.get("trade_channels"))
+        data["trade_channels"] = [TradeChannel.from_dict(tc) for tc in sanitized_channels]
+        data["trade_offers"] = normalize_trade_entries(raw.get("trade_offers", []))
+        data["trade_requests"] = normalize_trade_entries(raw.get("trade_requests", []))
 
-        sanitized_channels, channels_changed = sanitize_trade_channels(raw.get("trade_channels"))
-        data["trade_channels"] = sanitized_channels
-        changed = changed or channels_changed
+        settings = raw.get("settings")
+        data["settings"] = settings if isinstance(settings, dict) else {}
 
-        normalized_offers = normalize_trade_entries(raw.get("trade_offers", []))
-        normalized_requests = normalize_trade_entries(raw.get("trade_requests", []))
+        save_data(data)
+        return data
 
-        if normalized_offers != raw.get("trade_offers"):
-            changed = True
-        if normalized_requests != raw.get("trade_requests"):
-            changed = True
+    def write_text_atomic(path, text):
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            f.write(text)
+        tmp.replace(path)
+
+    class Histogram:
+        __slots__ = ("counts", "sum", "count")
+
+        BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+        def __init__(self):
+            self.counts = [0] * (len(self.BUCKETS) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+        def observe(self, value):
+            self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+            self.sum += value
+            self.count += 1
+
+        def cumulative(self):
+            total = 0
+            out = []
+            for bound, n in zip((*self.BUCKETS, float("inf")), self.counts):
+                total += n
+                out.append((bound, total))
+            return out
+
+    class Metrics:
+        """In-process counters and histograms, exported as Prometheus text and JSON."""
+
+        PREFIX = "blox_trader_"
+        HELP = {
+            "sends_total": "Send attempts by guild and result.",
+            "send_seconds": "Time spent in a single channel send.",
+            "renders_total": "Trade message renders by render cache result.",
+            "render_seconds": "Time to build an uncached trade message.",
+            "saves_total": "Data file saves by result.",
+            "save_seconds": "Time to serialize and write the data file.",
+            "scheduler_wakeups_total": "Auto loop wake-ups.",
+            "scheduler_due_total": "Channels handed to the dispatcher by the auto loop.",
+            "scheduler_lag_seconds": "Delay between a channel's deadline and its dispatch.",
+            "scheduler_cycle_seconds": "Time to dispatch one batch of due channels.",
+            "sends_skipped_total": "Sends not attempted because Discord would reject them.",
+        }
 
-        data["trade_offers"] = normalized_offers
-        data["trade_requests"] = normalized_requests
+        def __init__(self):
+            self.counters = {}
+            self.histograms = {}
+            self.task = None
+
+        @staticmethod
+        def key(name, labels):
+            return name, tuple(sorted(labels.items()))
+
+        def inc(self, name, value=1, **labels):
+            key = self.key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        def observe(self, name, value, **labels):
+            key = self.key(name, labels)
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+        @staticmethod
+        def format_labels(pairs):
+            if not pairs:
+                return ""
+            escaped = []
+            for k, v in pairs:
+                v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                escaped.append(f'{k}="{v}"')
+            return "{" + ",".join(escaped) + "}"
+
+        def to_prometheus(self):
+            lines = []
+            typed = set()
+
+            def header(name, kind):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# HELP {self.PREFIX}{name} {self.HELP.get(name, name)}")
+                    lines.append(f"# TYPE {self.PREFIX}{name} {kind}")
+
+            for (name, pairs), value in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.append(f"{self.PREFIX}{name}{self.format_labels(pairs)} {value}")
+
+            for (name, pairs), hist in sorted(self.histograms.items()):
+                header(name, "histogram")
+                for bound, total in hist.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.PREFIX}{name}_bucket{self.format_labels((*pairs, ('le', le)))} {total}")
+                lines.append(f"{self.PREFIX}{name}_sum{self.format_labels(pairs)} {hist.sum}")
+                lines.append(f"{self.PREFIX}{name}_count{self.format_labels(pairs)} {hist.count}")
+
+            return "\n".join(lines) + "\n"
+
+        def to_json(self):
+            return {
+                "generated_at": datetime.now().isoformat(),
+                "counters": [
+                    {"name": self.PREFIX + name, "labels": dict(pairs), "value": value}
+                    for (name, pairs), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {
+                        "name": self.PREFIX + name,
+                        "labels": dict(pairs),
+                        "buckets": {("+Inf" if b == float("inf") else repr(b)): n for b, n in hist.cumulative()},
+                        "sum": hist.sum,
+                        "count": hist.count,
+                    }
+                    for (name, pairs), hist in sorted(self.histograms.items())
+                ],
+            }
 
-        for tc in data.get("trade_channels", []):
-            if "cooldown_until" not in tc:
-                tc["cooldown_until"] = None
+        def snapshot(self):
+            return self.to_prometheus(), json.dumps(self.to_json(), separators=(",", ":"))
 
-        if changed:
-            save_data(data)
+        @staticmethod
+        def write(snapshot):
+            prom, doc = snapshot
+            write_text_atomic(METRICS_PROM_FILE, prom)
+            write_text_atomic(METRICS_JSON_FILE, doc)
 
-        return data
+        def export(self):
+            if not self.counters and not self.histograms:
+                return
+            try:
+                self.write(self.snapshot())
+            except:
+                pass
+
+        async def run(self):
+            while True:
+                interval = get_setting("metrics_export_interval")
+                if interval <= 0:
+                    await asyncio.sleep(30)
+                    continue
+                await asyncio.sleep(interval)
+                if not self.counters and not self.histograms:
+                    continue
+                try:
+                    # Rendered on the loop for a consistent view, written on a worker thread.
+                    await bot.loop.run_in_executor(None, self.write, self.snapshot())
+                except Exception as e:
+                    print(f"Metrics export failed: {e}", type_="WARNING")
+
+    metrics = Metrics()
+
+    def encode_data(body):
+        doc = {"schema_version": DATA_SCHEMA_VERSION, "content_hash": content_hash(body)}
+        doc.update(body)
+        return json.dumps(doc, separators=(",", ":"))
 
     def save_data(data):
+        """Writes the document inline. Only the load path uses this; runtime saves go through data_writer."""
+        started = time.perf_counter()
         try:
-            tmp = DATA_FILE.with_suffix(".tmp")
-            with open(tmp, "w") as f:
-                json.dump(data, f, indent=4)
-            tmp.replace(DATA_FILE)
+            with profiler.phase("save_data"):
+                write_text_atomic(DATA_FILE, encode_data(serialize_data(data)))
+            metrics.inc("saves_total", result="ok")
         except:
-            pass
+            metrics.inc("saves_total", result="error")
+        metrics.observe("save_seconds", time.perf_counter() - started)
+
+    def write_data_snapshot(body):
+        """Runs on a worker thread. Returns (ok, seconds) for DataStore.written() on the loop."""
+        started = time.perf_counter()
+        try:
+            write_text_atomic(DATA_FILE, encode_data(body))
+            return True, time.perf_counter() - started
+        except Exception as e:
+            return e, time.perf_counter() - started
+
+    CHANNEL_FIELDS = ("id", "server_id", "server_name", "server_icon", "channel_name",
+                      "cooldown", "slowmode", "last_sent", "trade_emoji", "cooldown_until",
+                      "failures", "health", "last_error")
+
+    class SqliteChannelStore:
+        """Channel rows in SQLite, used when settings.storage_backend is "sqlite"."""
+
+        SCHEMA = (
+            """CREATE TABLE IF NOT EXISTS trade_channels (
+                id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                server_id TEXT NOT NULL,
+                server_name TEXT NOT NULL DEFAULT '',
+                server_icon TEXT NOT NULL DEFAULT '',
+                channel_name TEXT NOT NULL,
+                cooldown INTEGER NOT NULL DEFAULT 60,
+                slowmode INTEGER,
+                last_sent TEXT,
+                trade_emoji TEXT,
+                cooldown_until TEXT,
+                failures INTEGER NOT NULL DEFAULT 0,
+                health TEXT NOT NULL DEFAULT 'healthy',
+                last_error TEXT,
+                next_eligible REAL NOT NULL DEFAULT 0
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_trade_channels_server ON trade_channels (server_id)",
+            "CREATE INDEX IF NOT EXISTS idx_trade_channels_next ON trade_channels (next_eligible)",
+        )
+        # Columns added after the first release, for databases created before them.
+        ADDED_COLUMNS = {
+            "slowmode": "INTEGER",
+            "failures": "INTEGER NOT NULL DEFAULT 0",
+            "health": "TEXT NOT NULL DEFAULT 'healthy'",
+            "last_error": "TEXT",
+        }
+
+        COLUMNS = ", ".join(CHANNEL_FIELDS)
+        UPDATES = ", ".join(f"{field} = excluded.{field}" for field in CHANNEL_FIELDS[1:])
+
+        SYNC_SQL = (
+            f"INSERT INTO trade_channels ({COLUMNS}, next_eligible, position) "
+            f"VALUES ({', '.join('?' * len(CHANNEL_FIELDS))}, ?, ?) "
+            f"ON CONFLICT(id) DO UPDATE SET {UPDATES}, next_eligible = excluded.next_eligible, position = excluded.position"
+        )
+        # A single-row save keeps an existing row's position and appends new ones.
+        UPSERT_SQL = (
+            f"INSERT INTO trade_channels ({COLUMNS}, next_eligible, position) "
+            f"VALUES ({', '.join('?' * len(CHANNEL_FIELDS))}, ?, "
+            f"(SELECT COALESCE(MAX(position), -1) + 1 FROM trade_channels)) "
+            f"ON CONFLICT(id) DO UPDATE SET {UPDATES}, next_eligible = excluded.next_eligible"
+        )
+
+        def __init__(self, path):
+            # Every statement after setup runs on this one thread, so writes keep their order
+            # and never block the event loop.
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blox-sqlite")
+            self.conn = sqlite3.connect(str(path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            with self.conn:
+                for statement in self.SCHEMA:
+                    self.conn.execute(statement)
+                existing = {row[1] for row in self.conn.execute("PRAGMA table_info(trade_channels)")}
+                for column, kind in self.ADDED_COLUMNS.items():
+                    if column not in existing:
+                        self.conn.execute(f"ALTER TABLE trade_channels ADD COLUMN {column} {kind}")
+
+        def params(self, channel):
+            entry = channel.to_dict()
+            return [entry[field] for field in CHANNEL_FIELDS] + [channel.wall_deadline()]
+
+        def rows(self, channels):
+            return [self.params(channel) + [position] for position, channel in enumerate(channels)]
+
+        def read_rows(self):
+            return self.conn.execute(f"SELECT {self.COLUMNS} FROM trade_channels ORDER BY position").fetchall()
+
+        def write_upsert(self, params):
+            with self.conn:
+                self.conn.execute(self.UPSERT_SQL, params)
+
+        def write_sync(self, rows, removed):
+            with self.conn:
+                if removed:
+                    self.conn.executemany("DELETE FROM trade_channels WHERE id = ?", [(cid,) for cid in removed])
+                self.conn.executemany(self.SYNC_SQL, rows)
+
+        def load(self):
+            # Queued behind any pending writes, so the rows read back are current.
+            rows = self.executor.submit(self.read_rows).result()
+            return [TradeChannel.from_dict(dict(zip(CHANNEL_FIELDS, row))) for row in rows]
+
+        def write_append(self, params):
+            with self.conn:
+                self.conn.executemany(self.UPSERT_SQL, params)
+
+        def write_clear(self):
+            with self.conn:
+                self.conn.execute("DELETE FROM trade_channels")
+
+        def append(self, channels):
+            """Adds channels after the existing rows; ids already stored keep their position."""
+            self.executor.submit(self.write_append, [self.params(channel) for channel in channels]).result()
+
+        def clear(self):
+            self.executor.submit(self.write_clear).result()
+
+        def submit(self, fn, *args):
+            """Queues a write; parameters are built by the caller on the loop."""
+            self.executor.submit(fn, *args).add_done_callback(self.report)
+
+        @staticmethod
+        def report(future):
+            error = future.exception()
+            if error is not None:
+                print(f"SQLite save failed: {error}", type_="ERROR")
+
+        def close(self):
+            self.executor.shutdown(wait=True)
+            self.conn.close()
+
+    class DataStore:
+        """In-memory copy of the data file, re-read only after an outside edit."""
+
+        def __init__(self):
+            self.data = None
+            self.stamp = None
+            self.index = None
+            self.generation = 0
+            self.db = None
+            self.removed = set()
+            self.pending = False
+
+        def file_stamp(self):
+            try:
+                st = DATA_FILE.stat()
+                return (st.st_mtime_ns, st.st_size)
+            except OSError:
+                return None
+
+        def get(self):
+            # While a save is queued or being written the file is ours and mid-update,
+            # so it is not checked for outside edits.
+            if self.data is None or (not data_writer.busy() and self.file_stamp() != self.stamp):
+                with profiler.phase("load_data"):
+                    self.data = load_data()
+                    self.attach_backend()
+                profiler.configure(self.data["settings"])
+                self.stamp = self.file_stamp()
+                self.index = None
+                self.generation += 1
+            return self.data
+
+        def attach_backend(self):
+            # Read directly: get_setting() would re-enter get() while it is still loading.
+            if self.data["settings"].get("storage_backend", DEFAULT_SETTINGS["storage_backend"]) != "sqlite":
+                self.export_backend()
+                return
+
+            try:
+                if self.db is None:
+                    self.db = SqliteChannelStore(CHANNEL_DB_FILE)
+
+                # One-shot migration: channels still in the JSON file move into the database,
+                # after any rows it already holds.
+                json_channels = self.data["trade_channels"]
+                if json_channels:
+                    self.db.append(json_channels)
+                    print(f"Migrated {len(json_channels)} channels to SQLite", type_="SUCCESS")
+                self.data["trade_channels"] = self.db.load()
+                if json_channels:
+                    save_data(self.meta())
+            except sqlite3.Error as e:
+                print(f"SQLite unavailable, using JSON storage: {e}", type_="ERROR")
+                self.db = None
+
+        def export_backend(self):
+            """Back on JSON storage: channels left in the database move into the JSON file."""
+            db, self.db = self.db, None
+            if self.data["trade_channels"] or (db is None and not CHANNEL_DB_FILE.exists()):
+                if db is not None:
+                    db.close()
+                return
+
+            try:
+                if db is None:
+                    db = SqliteChannelStore(CHANNEL_DB_FILE)
+                channels = db.load()
+                if channels:
+                    self.data["trade_channels"] = channels
+                    save_data(self.data)
+                    db.clear()
+                    print(f"Exported {len(channels)} channels from SQLite", type_="SUCCESS")
+            except sqlite3.Error as e:
+                print(f"Could not read channels from SQLite: {e}", type_="ERROR")
+            finally:
+                if db is not None:
+                    db.close()
+
+        def meta(self):
+            meta = dict(self.data)
+            meta["trade_channels"] = []
+            return meta
+
+        def save(self):
+            """Queues a write; bursts of saves coalesce into one background write."""
+            if self.db is not None:
+                self.db.submit(self.db.write_sync, self.db.rows(self.data["trade_channels"]), list(self.removed))
+            self.removed = set()
+            self.pending = False
+            data_writer.mark_dirty()
+
+        def snapshot(self):
+            """Taken on the loop: everything the worker thread serializes is a private copy."""
+            with profiler.phase("save_snapshot"):
+                body = serialize_data(self.meta() if self.db is not None else self.data)
+                body["trade_offers"] = list(body["trade_offers"])
+                body["trade_requests"] = list(body["trade_requests"])
+                body["settings"] = copy.deepcopy(body["settings"])
+            return body
+
+        def written(self, result):
+            ok, seconds = result
+            metrics.observe("save_seconds", seconds)
+            if ok is True:
+                metrics.inc("saves_total", result="ok")
+                self.stamp = self.file_stamp()
+            else:
+                metrics.inc("saves_total", result="error")
+                print(f"Saving {DATA_FILE.name} failed: {ok}", type_="ERROR")
+
+        def close(self):
+            if self.db is not None:
+                self.db.close()
+
+        def save_channel(self, channel):
+            """Persists one channel's send state: a queued single-row update on SQLite, deferred to flush() on JSON."""
+            if self.db is None:
+                self.pending = True
+                return
+            self.db.submit(self.db.write_upsert, self.db.params(channel))
+
+        def flush(self):
+            if self.pending:
+                self.save()
+
+        def channel(self, cid):
+            if self.index is None:
+                self.index = {tc.id: tc for tc in self.get()["trade_channels"]}
+            return self.index.get(cid)
+
+        def add_channel(self, entry):
+            self.get()["trade_channels"].append(entry)
+            if self.index is not None:
+                self.index[entry.id] = entry
+            return entry
+
+        def remove_channel(self, cid):
+            d = self.get()
+            before = len(d["trade_channels"])
+            d["trade_channels"] = [tc for tc in d["trade_channels"] if tc.id != cid]
+            if self.index is not None:
+                self.index.pop(cid, None)
+            removed = before - len(d["trade_channels"])
+            if removed:
+                self.removed.add(cid)
+            return removed
+
+    def get_setting(key):
+        value = store.get()["settings"].get(key)
+        default = DEFAULT_SETTINGS[key]
+        if value is None:
+            return default
+        try:
+            return type(default)(value)
+        except (TypeError, ValueError):
+            return default
 
     def load_emoji_cache():
         try:
@@ -266,66 +1296,189 @@ def blox_fruits_trader():
 
     def save_emoji_cache(cache):
         try:
-            with open(EMOJI_CACHE_FILE, "w") as f:
-                json.dump(cache, f, indent=4)
+            write_text_atomic(EMOJI_CACHE_FILE, json.dumps(cache, separators=(",", ":")))
         except:
             pass
 
-    def get_cooldown_remaining(channel):
-        try:
-            cooldown_val = int(channel.get("cooldown", 60))
-        except:
-            cooldown_val = 60
-
-        base_remaining = 0
-        last_sent = channel.get("last_sent")
-        if last_sent:
-            try:
-                last = datetime.fromisoformat(last_sent)
-                elapsed = (datetime.now() - last).total_seconds()
-                base_remaining = max(0, int(cooldown_val - elapsed))
-            except:
-                base_remaining = 0
-
-        extra_remaining = 0
-        cooldown_until = channel.get("cooldown_until")
-        if cooldown_until:
-            try:
-                target = datetime.fromisoformat(cooldown_until)
-                extra_remaining = max(0, int((target - datetime.now()).total_seconds()))
-            except:
-                extra_remaining = 0
+    class EmojiCache:
+        """Per-guild term -> emoji string cache with LRU eviction and short-lived misses."""
+
+        def __init__(self, raw):
+            self.guilds = OrderedDict()
+            self.misses = {}
+            self.total = 0
+            self.repaired = not isinstance(raw, dict)
+            for gs, entries in (raw.items() if isinstance(raw, dict) else ()):
+                if not isinstance(entries, dict):
+                    self.repaired = True
+                    continue
+                self.guilds[gs] = OrderedDict(entries)
+                self.total += len(entries)
 
-        return max(base_remaining, extra_remaining)
+        def get(self, gs, key):
+            entries = self.guilds.get(gs)
+            if entries is None:
+                return None
+            es = entries.get(key)
+            if es is not None:
+                self.guilds.move_to_end(gs)
+                entries.move_to_end(key)
+            return es
+
+        def put(self, gs, key, es):
+            entries = self.guilds.get(gs)
+            if entries is None:
+                entries = self.guilds[gs] = OrderedDict()
+            if key not in entries:
+                self.total += 1
+            entries[key] = es
+            entries.move_to_end(key)
+            self.guilds.move_to_end(gs)
+
+        def is_miss(self, gs, key):
+            misses = self.misses.get(gs)
+            if not misses:
+                return False
+            expires = misses.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del misses[key]
+                return False
+            return True
+
+        def put_miss(self, gs, key):
+            ttl = get_setting("emoji_miss_ttl")
+            if ttl > 0:
+                self.misses.setdefault(gs, {})[key] = time.monotonic() + ttl
+
+        def discard_key(self, key):
+            removed = False
+            for entries in self.guilds.values():
+                if key in entries:
+                    del entries[key]
+                    self.total -= 1
+                    removed = True
+            return removed
+
+        def prune(self, gs, emoji_ids):
+            """Drops a guild's entries that use a custom emoji it no longer has."""
+            entries = self.guilds.get(gs)
+            if not entries:
+                return False
+            dead = [key for key, es in entries.items()
+                    if any(eid not in emoji_ids for eid in CUSTOM_EMOJI_ID_PATTERN.findall(es))]
+            for key in dead:
+                del entries[key]
+            self.total -= len(dead)
+            return bool(dead)
+
+        def drop_guild(self, gs):
+            self.misses.pop(gs, None)
+            entries = self.guilds.pop(gs, None)
+            if entries is None:
+                return False
+            self.total -= len(entries)
+            return True
+
+        def evict(self):
+            max_guilds = max(1, get_setting("emoji_cache_max_guilds"))
+            max_entries = max(1, get_setting("emoji_cache_max_entries"))
+            evicted = False
+
+            while len(self.guilds) > max_guilds:
+                gs, entries = self.guilds.popitem(last=False)
+                self.misses.pop(gs, None)
+                self.total -= len(entries)
+                evicted = True
+
+            while self.total > max_entries and self.guilds:
+                gs, entries = next(iter(self.guilds.items()))
+                if entries:
+                    entries.popitem(last=False)
+                    self.total -= 1
+                if not entries:
+                    del self.guilds[gs]
+                evicted = True
+
+            return evicted
+
+        def to_json(self):
+            return {gs: dict(entries) for gs, entries in self.guilds.items()}
+
+    class DebouncedWriter:
+        """Coalesces saves of a document into one write per interval, run off the event loop."""
+
+        def __init__(self, snapshot, write, interval, written=None):
+            self.snapshot = snapshot
+            self.write = write
+            self.interval = interval
+            self.written = written
+            self.dirty = False
+            self.writing = False
+            self.task = None
+            self.lock = asyncio.Lock()
+
+        def busy(self):
+            return self.dirty or self.writing
+
+        def mark_dirty(self):
+            self.dirty = True
+            if not bot.loop.is_running():
+                return  # shutting down; flush_now() picks it up
+            if self.task is None or self.task.done():
+                self.task = bot.loop.create_task(self.flush_later())
+
+        async def flush_later(self):
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+        async def flush(self):
+            async with self.lock:
+                if not self.dirty:
+                    return
+                self.dirty = False
+                doc = self.snapshot()
+                self.writing = True
+                try:
+                    result = await bot.loop.run_in_executor(None, self.write, doc)
+                finally:
+                    self.writing = False
+                if self.written:
+                    self.written(result)
+            # A save that came in during the write found the task still running; pick it up now.
+            if self.dirty and (self.task is None or self.task.done() or self.task is asyncio.current_task()):
+                self.task = bot.loop.create_task(self.flush_later())
+
+        def flush_now(self):
+            # Shutdown path: the loop may already be gone, so write inline.
+            if self.dirty:
+                self.dirty = False
+                result = self.write(self.snapshot())
+                if self.written:
+                    self.written(result)
 
     def build_channel_row(channel):
-        try:
-            cid = str(channel.get("id", "")).strip()
-        except Exception:
-            cid = ""
-
-        if not cid:
-            return None
-
-        try:
-            cooldown_val = int(channel.get("cooldown", 60))
-        except (TypeError, ValueError):
-            cooldown_val = 60
-
-        remaining = get_cooldown_remaining(channel)
-        status = f"CD: {remaining}s" if remaining > 0 else "Ready"
-        last_sent = channel.get("last_sent") or "Never"
-        last_sent = str(last_sent)[:19]
+        remaining = channel.remaining()
+        if channel.health == "quarantined":
+            status = f"Quarantined: {channel.last_error}"
+        elif remaining > 0:
+            # An absolute time stays correct between table refreshes; a seconds countdown would go stale.
+            until = format_timestamp(channel.wall_deadline())[11:19]
+            status = f"Backoff until {until}" if channel.health == "backoff" else f"CD until {until}"
+        else:
+            status = "Ready"
+        last_sent = format_timestamp(channel.last_sent)[:19] if channel.last_sent is not None else "Never"
 
         return {
-            "id": cid,
+            "id": channel.id,
             "cells": [
                 {
-                    "text": channel.get("channel_name", "?"),
-                    "imageUrl": channel.get("server_icon", ""),
-                    "subtext": channel.get("server_name", ""),
+                    "text": channel.channel_name or "?",
+                    "imageUrl": channel.server_icon,
+                    "subtext": channel.server_name,
                 },
-                {"text": f"{cooldown_val}s", "subtext": status},
+                {"text": f"{channel.cooldown}s", "subtext": status},
                 {"text": status, "subtext": last_sent},
                 {},
             ],
@@ -339,25 +1492,136 @@ def blox_fruits_trader():
         except TypeError:
             return str(err)
 
-    data = load_data()
-    emoji_cache = load_emoji_cache()
+    def classify_error(err):
+        if isinstance(err, dict):
+            if err.get("skipped"):
+                return "slowmode_skip"
+            if err.get("type") == "cooldown":
+                return "rate_limited"
+            return str(err.get("type") or "error")
+        if err == "No perm":
+            return "forbidden"
+        if err == "Not found":
+            return "not_found"
+        if isinstance(err, str) and err.startswith("HTTP error"):
+            return "http_error"
+        if isinstance(err, str) and err.startswith("Too long"):
+            return "too_long"
+        return "exception"
+
+    class EventLog:
+        """Failure counts per (channel, error class) plus a ring buffer of recent events."""
+
+        def __init__(self):
+            self.counts = {}
+            self.names = {}
+            self.recent = deque(maxlen=max(1, get_setting("event_log_size")))
+            self.pending = []
+            self.task = None
+
+        def reset(self):
+            self.counts = {}
+            self.names = {}
+            self.recent = deque(maxlen=max(1, get_setting("event_log_size")))
+
+        def record(self, channel, err):
+            cls = classify_error(err)
+            message = describe_error(err)
+            key = (channel.id, cls)
+            entry = self.counts.get(key)
+            if entry is None:
+                self.counts[key] = [1, message]
+            else:
+                entry[0] += 1
+                entry[1] = message
+            self.names[channel.id] = channel.channel_name
+
+            event = {
+                "time": datetime.now().isoformat(),
+                "channel_id": channel.id,
+                "channel": channel.channel_name,
+                "class": cls,
+                "message": message,
+            }
+            self.recent.append(event)
+
+            if get_setting("event_log_file"):
+                self.pending.append(json.dumps(event, separators=(",", ":")))
+                if self.task is None or self.task.done():
+                    self.task = bot.loop.create_task(self.flush())
+
+        def total(self):
+            return sum(entry[0] for entry in self.counts.values())
+
+        def summary(self):
+            rows = sorted(self.counts.items(), key=lambda item: -item[1][0])
+            return [
+                f"[{count}x] {self.names.get(cid, cid)} ({cls}): {message}"
+                for (cid, cls), (count, message) in rows
+            ]
+
+        def print_summary(self, title="Auto-send Error Summary"):
+            if not self.counts:
+                print("No send errors recorded", type_="INFO")
+                return
+            print(f"\n=== {title} ({self.total()} errors) ===", type_="WARNING")
+            for line in self.summary():
+                print(f"  {line}", type_="ERROR")
+
+        @staticmethod
+        def append_lines(lines, limit):
+            try:
+                if limit > 0 and EVENT_LOG_FILE.stat().st_size >= limit:
+                    EVENT_LOG_FILE.replace(EVENT_LOG_FILE.with_name(EVENT_LOG_FILE.name + ".1"))
+            except FileNotFoundError:
+                pass
+            with open(EVENT_LOG_FILE, "a") as f:
+                f.write("\n".join(lines) + "\n")
+
+        async def flush(self):
+            while self.pending:
+                lines, self.pending = self.pending, []
+                try:
+                    await bot.loop.run_in_executor(None, self.append_lines, lines, get_setting("event_log_max_bytes"))
+                except Exception as e:
+                    print(f"Event log write failed: {e}", type_="WARNING")
+
+    store = DataStore()
+    data_writer = DebouncedWriter(store.snapshot, write_data_snapshot, DATA_FLUSH_INTERVAL, store.written)
+    data = store.get()
+    event_log = EventLog()
+    emoji_cache = EmojiCache(load_emoji_cache())
+    emoji_indexes = {}
+    # Template text -> compiled plan; a template is parsed once for the life of the script.
+    template_plans = {}
+    # Per guild: {"trade": ..., "or": ...}, resolved once per emoji set.
+    special_emojis = {}
+    render_cache = {}
+    emoji_cache_writer = DebouncedWriter(
+        emoji_cache.to_json,
+        save_emoji_cache,
+        EMOJI_CACHE_FLUSH_INTERVAL,
+    )
+    atexit.register(emoji_cache_writer.flush_now)
+    atexit.register(store.close)
+    def flush_data_now():
+        store.flush()
+        data_writer.flush_now()
+
+    atexit.register(flush_data_now)
+    atexit.register(metrics.export)
+    atexit.register(profiler.report)
+    scheduler = CooldownScheduler()
 
     # Ensure new aliases bypass any stale cache entries so they resolve immediately.
     CACHE_PURGE_KEYS = {"storage", "storages"}
-    cache_purged = False
-    for guild_id, entries in list(emoji_cache.items()):
-        if not isinstance(entries, dict):
-            emoji_cache[guild_id] = {}
+    cache_purged = emoji_cache.repaired
+    for key in CACHE_PURGE_KEYS:
+        if emoji_cache.discard_key(key):
             cache_purged = True
-            continue
 
-        for key in CACHE_PURGE_KEYS:
-            if key in entries:
-                del entries[key]
-                cache_purged = True
-
-    if cache_purged:
-        save_emoji_cache(emoji_cache)
+    if emoji_cache.evict() or cache_purged:
+        emoji_cache_writer.mark_dirty()
 
     # UI
     tab = Tab(name='BF Trader', title="Blox Fruits Trader", icon="convert")
@@ -378,12 +1642,26 @@ def blox_fruits_trader():
     req_in = trade.create_ui_element(UI.Input, label="Requesting", placeholder="rumble, tiger", full_width=True, show_clear_button=True)
     save_btn = trade.create_ui_element(UI.Button, label='Save', disabled=True, color="default")
 
+    # Detection rules
+    rules = card.create_group(type="columns", gap=3, full_width=True)
+    kw_in = rules.create_ui_element(UI.Input, label="Detect Keywords", placeholder="trading, trade-chat", full_width=True, show_clear_button=True)
+    exc_in = rules.create_ui_element(UI.Input, label="Exclude Prefixes", placeholder="pvb, sab", full_width=True, show_clear_button=True)
+    pat_in = rules.create_ui_element(UI.Input, label="Name Patterns", placeholder="^trade-\\d{1,3}$ ^deals-", full_width=True, show_clear_button=True)
+    rules_btn = rules.create_ui_element(UI.Button, label='Save Rules', color="default")
+
+    # Message template; scoped to the Channel IDs or Server ID inputs when they are filled
+    layout = card.create_group(type="columns", gap=3, full_width=True)
+    tpl_in = layout.create_ui_element(UI.Input, label="Message Template", placeholder=DEFAULT_TEMPLATE, full_width=True, show_clear_button=True)
+    tpl_btn = layout.create_ui_element(UI.Button, label='Save Template', color="default")
+
     # Controls
     ctrl = card.create_group(type="columns", gap=3, full_width=True)
     auto_check = ctrl.create_ui_element(UI.Checkbox, label='Auto Send Mode', checked=False)
     start_btn = ctrl.create_ui_element(UI.Button, label='Start', disabled=True, color="success")
     stop_btn = ctrl.create_ui_element(UI.Button, label='Stop', disabled=True, color="danger")
     test_btn = ctrl.create_ui_element(UI.Button, label='Test Format', color="default")
+    log_btn = ctrl.create_ui_element(UI.Button, label='Error Summary', color="default")
+    prof_check = ctrl.create_ui_element(UI.Checkbox, label='Profiling', checked=profiler.enabled)
 
     # Tables
     tables = card.create_group(type="columns", gap=6, full_width=True)
@@ -449,6 +1727,13 @@ def blox_fruits_trader():
         except:
             return "🔁"
 
+    async def guild_special_emoji(guild, kind):
+        get_emoji_index(guild)
+        cached = special_emojis.setdefault(str(guild.id), {})
+        if kind not in cached:
+            cached[kind] = await (find_trade_emoji(guild) if kind == "trade" else find_or_emoji(guild))
+        return cached[kind]
+
     async def resolve_compound_token(gid, term):
         parts = COMPOUND_SPLIT_PATTERN.split(term)
         resolved = []
@@ -472,6 +1757,37 @@ def blox_fruits_trader():
             return "".join(resolved)
         return None
 
+    def get_emoji_index(guild):
+        gs = str(guild.id)
+        index = emoji_indexes.get(gs)
+        # discord.py swaps in a new emoji tuple on every change, so identity is enough.
+        if index is None or index.source is not guild.emojis:
+            if index is not None:
+                # The emoji set changed without us seeing the event; earlier hits may be dead.
+                forget_guild_emojis(gs)
+            elif emoji_cache.prune(gs, {str(e.id) for e in guild.emojis}):
+                # First look at this guild this session: entries saved earlier may name deleted emojis.
+                emoji_cache_writer.mark_dirty()
+            index = GuildEmojiIndex(guild.emojis)
+            emoji_indexes[gs] = index
+            invalidate_rendered(gs)
+        return index
+
+    def forget_guild_emojis(gid):
+        gs = str(gid)
+        preflight.external.clear()
+        emoji_indexes.pop(gs, None)
+        special_emojis.pop(gs, None)
+        invalidate_rendered(gs)
+        if emoji_cache.drop_guild(gs):
+            emoji_cache_writer.mark_dirty()
+
+    def invalidate_rendered(gid=None):
+        if gid is None:
+            render_cache.clear()
+        else:
+            render_cache.pop(str(gid), None)
+
     async def fetch_emoji(gid, term):
         term = term.strip()
         if not term:
@@ -490,83 +1806,126 @@ def blox_fruits_trader():
 
         if lookup_term.lower() == "or":
             g = bot.get_guild(int(gid))
-            return await find_or_emoji(g) if g else "🔁"
+            return await guild_special_emoji(g, "or") if g else "🔁"
 
         gs = str(gid)
         tl = lookup_term.lower()
         original_lower = term.lower()
 
-        if gs in emoji_cache:
-            if tl in emoji_cache[gs]:
-                return emoji_cache[gs][tl]
-            if original_lower != tl and original_lower in emoji_cache[gs]:
-                return emoji_cache[gs][original_lower]
+        g = bot.get_guild(int(gid))
+        if g:
+            # Checks cached hits against the guild's current emojis before they are used.
+            get_emoji_index(g)
+
+        cached = emoji_cache.get(gs, tl)
+        if cached is None and original_lower != tl:
+            cached = emoji_cache.get(gs, original_lower)
+        if cached is not None:
+            return cached
+        if emoji_cache.is_miss(gs, tl):
+            return None
 
         try:
-            g = bot.get_guild(int(gid))
             if not g:
                 return None
 
-            for e in g.emojis:
-                if tl in e.name.lower():
-                    es = f"<:{e.name}:{e.id}>" if not e.animated else f"<a:{e.name}:{e.id}>"
-                    if gs not in emoji_cache:
-                        emoji_cache[gs] = {}
-                    emoji_cache[gs][tl] = es
-                    if original_lower != tl:
-                        emoji_cache[gs][original_lower] = es
-                    save_emoji_cache(emoji_cache)
-                    return es
-
-            if tl in FRUIT_ALIASES:
-                for alias in FRUIT_ALIASES[tl]:
-                    for e in g.emojis:
-                        if alias in e.name.lower():
-                            es = f"<:{e.name}:{e.id}>" if not e.animated else f"<a:{e.name}:{e.id}>"
-                            if gs not in emoji_cache:
-                                emoji_cache[gs] = {}
-                            emoji_cache[gs][tl] = es
-                            if original_lower != tl:
-                                emoji_cache[gs][original_lower] = es
-                            save_emoji_cache(emoji_cache)
-                            return es
-            return None
+            es = get_emoji_index(g).lookup(tl)
+            if not es:
+                emoji_cache.put_miss(gs, tl)
+                return None
+
+            emoji_cache.put(gs, tl, es)
+            if original_lower != tl:
+                emoji_cache.put(gs, original_lower, es)
+            emoji_cache.evict()
+            emoji_cache_writer.mark_dirty()
+            return es
         except:
             return None
 
-    async def build_msg(gid, offers, requests, te=None):
+    def template_for(server_id, cid=None):
+        templates = get_setting("message_templates")
+        for scope, key in (("channels", cid), ("guilds", server_id)):
+            overrides = templates.get(scope)
+            if key is not None and isinstance(overrides, dict) and overrides.get(str(key)):
+                return overrides[str(key)]
+        return templates.get("default") or DEFAULT_TEMPLATE
+
+    def template_plan(text):
+        plan = template_plans.get(text)
+        if plan is None:
+            try:
+                plan = compile_template(text)
+            except ValueError as e:
+                print(f"Invalid message template {text!r} ({e}), using default", type_="WARNING")
+                plan = compile_template(DEFAULT_TEMPLATE)
+            template_plans[text] = plan
+        return plan
+
+    async def build_msg(gid, offers, requests, te=None, template=DEFAULT_TEMPLATE):
         g = bot.get_guild(int(gid))
-        if not te:
-            te = await find_trade_emoji(g) if g else "↔️"
+        if g:
+            # Rebuilds the index (and drops this guild's renders) if its emojis changed.
+            get_emoji_index(g)
 
-        oe = []
-        for o in offers:
-            if o in SEPARATOR_TOKENS:
-                oe.append(o)
-                continue
-
-            e = await fetch_emoji(gid, o.strip())
-            oe.append(e if e else f"`{o.strip()}`")
-
-        re = []
-        for r in requests:
-            if r in SEPARATOR_TOKENS:
-                re.append(r)
-                continue
+        gs = str(gid)
+        key = (tuple(offers), tuple(requests), te, template)
+        cached = render_cache.get(gs, {}).get(key)
+        if cached is not None:
+            metrics.inc("renders_total", cache="hit")
+            return cached
+
+        started = time.perf_counter()
+        with profiler.phase("build_msg"):
+            if not te:
+                te = await guild_special_emoji(g, "trade") if g else "↔️"
+
+            # Each distinct item is resolved once, then repeated per its run count.
+            resolved = {}
+            for item, _ in (*offers, *requests):
+                if item in resolved:
+                    continue
+                if item in SEPARATOR_TOKENS:
+                    resolved[item] = item
+                    continue
 
-            e = await fetch_emoji(gid, r.strip())
-            re.append(e if e else f"`{r.strip()}`")
+                with profiler.phase("fetch_emoji"):
+                    e = await fetch_emoji(gid, item.strip())
+                resolved[item] = e if e else f"`{item.strip()}`"
+
+            values = {"trade": te, "nl": "\n"}
+            parts = []
+            for field, text in template_plan(template):
+                if field is None:
+                    parts.append(text)
+                elif field in ("offers", "requests"):
+                    runs = offers if field == "offers" else requests
+                    parts.append(text.join(resolved[item] for item, count in runs for _ in range(count)))
+                else:
+                    if field not in values:
+                        values[field] = await guild_special_emoji(g, "or") if g else "🔁"
+                    parts.append(values[field])
 
-        return f"{' '.join(oe)} {te} {' '.join(re)}"
+            msg = "".join(parts)
+            render_cache.setdefault(gs, {})[key] = msg
+        metrics.inc("renders_total", cache="miss")
+        metrics.observe("render_seconds", time.perf_counter() - started)
+        return msg
 
     async def send_to(cid, msg):
+        ch = None
+        started = time.perf_counter()
+        result = "error"
         try:
             ch = bot.get_channel(int(cid))
             if not ch:
+                result = "not_found"
                 return False, "Not found"
             await ch.send(msg)
+            result = "ok"
             return True, "OK"
         except discord.errors.Forbidden:
+            result = "forbidden"
             return False, "No perm"
         except discord.errors.HTTPException as e:
             status = getattr(e, "status", None)
@@ -574,33 +1933,262 @@ def blox_fruits_trader():
             retry_after = getattr(e, "retry_after", None)
 
             if retry_after is not None and (status == 429 or code == 20028):
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                is_global = str(headers.get("X-RateLimit-Global", "")).lower() == "true"
+                result = "rate_limited_global" if is_global else "rate_limited"
                 return False, {
                     "type": "cooldown",
                     "retry_after": retry_after,
                     "status": status,
-                    "code": code
+                    "code": code,
+                    "global": is_global
                 }
 
+            result = "http_error"
             return False, f"HTTP error (status={status}, code={code})"
         except Exception as e:
             return False, f"Error: {e}"
+        finally:
+            guild = getattr(getattr(ch, "guild", None), "id", "unknown")
+            metrics.inc("sends_total", guild=guild, result=result)
+            if result != "not_found":
+                metrics.observe("send_seconds", time.perf_counter() - started)
+
+    def apply_send_result(channel, ok, err):
+        """Moves the channel's deadline after a send. Returns the 429 retry delay, or 0."""
+        table_refresher.mark(channel.id)
+        if ok:
+            channel.mark_sent()
+            channel.record_success()
+            scheduler.track(channel)
+            store.save_channel(channel)
+            return 0
+
+        if not (isinstance(err, dict) and err.get("type") == "cooldown"):
+            # Dead or broken channel: back off per error class instead of retrying every cooldown.
+            if channel.record_failure(classify_error(err)) is None:
+                print(f"Quarantined {channel.channel_name} after {channel.failures} {channel.last_error} failures", type_="WARNING")
+            scheduler.track(channel)
+            store.save_channel(channel)
+            return 0
+
+        try:
+            retry_seconds = float(err.get("retry_after", 0))
+        except (TypeError, ValueError):
+            retry_seconds = 0
+
+        # A slowmode 429 means the slowmode is at least retry_after. Only learned
+        # when the gateway cache has not shown the channel's slowmode; otherwise
+        # the live value is reconciled before the next send.
+        if (err.get("code") == SLOWMODE_ERROR_CODE and channel.slowmode is None
+                and retry_seconds > channel.cooldown):
+            channel.cooldown = min(MAX_SLOWMODE, math.ceil(retry_seconds))
+
+        channel.block_for(retry_seconds if retry_seconds > 0 else channel.cooldown)
+        scheduler.track(channel)
+        store.save_channel(channel)
+        return max(retry_seconds, 0)
+
+    def slowmode_exempt(ch):
+        try:
+            perms = ch.permissions_for(ch.guild.me)
+        except Exception:
+            return False
+        return bool(getattr(perms, "manage_channels", False) or getattr(perms, "manage_messages", False))
+
+    def reconcile_cooldown(channel):
+        """Syncs the cooldown with the live slowmode_delay. Returns seconds Discord would still reject for, or 0."""
+        ch = bot.get_channel(int(channel.id))
+        try:
+            sd = int(getattr(ch, "slowmode_delay", None))
+        except (TypeError, ValueError):
+            return 0
+
+        if sd != channel.slowmode:
+            previous = channel.slowmode
+            channel.slowmode = sd
+            if previous is None:
+                # First sighting: keep a hand-set cooldown unless it is shorter than slowmode.
+                channel.cooldown = max(channel.cooldown, sd)
+            else:
+                channel.cooldown = sd if sd else 60
+            table_refresher.mark(channel.id)
+            store.save_channel(channel)
+
+        if sd <= 0 or channel.sent_at is None or slowmode_exempt(ch):
+            return 0
+        return max(0.0, channel.sent_at + sd - time.monotonic())
+
+    class Preflight:
+        """Rejects sends Discord would refuse, without making the request."""
+
+        def __init__(self):
+            self.channels = {}
+            self.external = {}
+
+        def channel_state(self, cid):
+            # Existence is not cached: a channel missing during an outage must work again once it is back.
+            ch = bot.get_channel(int(cid))
+            if ch is None:
+                return None, "Not found", False
+            state = self.channels.get(cid)
+            if state is None:
+                state = self.channels[cid] = self.inspect(ch)
+            return state
+
+        @staticmethod
+        def inspect(ch):
+            """Returns (guild id, rejection or None, may use external emojis)."""
+            guild = getattr(ch, "guild", None)
+            gid = getattr(guild, "id", None)
+            try:
+                perms = ch.permissions_for(guild.me)
+            except Exception:
+                # Unknown permissions: let Discord decide.
+                return gid, None, True
+            if not getattr(perms, "send_messages", True):
+                return gid, "No perm", False
+            return gid, None, bool(getattr(perms, "use_external_emojis", True))
+
+        def uses_external(self, gid, msg):
+            key = (gid, msg)
+            found = self.external.get(key)
+            if found is None:
+                guild = bot.get_guild(int(gid)) if gid is not None else None
+                own = {str(e.id) for e in guild.emojis} if guild is not None else set()
+                found = any(eid not in own for eid in CUSTOM_EMOJI_ID_PATTERN.findall(msg))
+                if len(self.external) > 1024:
+                    self.external.clear()
+                self.external[key] = found
+            return found
+
+        def check(self, cid, msg):
+            """Returns why the send would be rejected, or None."""
+            if len(msg) > MAX_MESSAGE_LENGTH:
+                return f"Too long ({len(msg)} > {MAX_MESSAGE_LENGTH} characters)"
+            gid, reason, external_ok = self.channel_state(cid)
+            if reason:
+                return reason
+            if not external_ok and self.uses_external(gid, msg):
+                return "No perm"
+            return None
+
+        def invalidate(self, cid):
+            self.channels.pop(str(cid), None)
+
+        def invalidate_guild(self, guild_id):
+            self.channels = {cid: state for cid, state in self.channels.items() if state[0] != guild_id}
+            self.external = {key: found for key, found in self.external.items() if key[0] != guild_id}
+
+    preflight = Preflight()
+
+    class RateBucket:
+        __slots__ = ("lock", "blocked_until")
+
+        def __init__(self):
+            self.lock = asyncio.Lock()
+            self.blocked_until = 0.0
+
+    class SendDispatcher:
+        """Runs sends concurrently, one in flight per channel, paced by rate-limit state."""
+
+        def __init__(self):
+            self.buckets = {}
+            self.global_until = 0.0
+            self.next_slot = 0.0
+
+        def bucket(self, cid):
+            bucket = self.buckets.get(cid)
+            if bucket is None:
+                bucket = self.buckets[cid] = RateBucket()
+            return bucket
+
+        def forget(self, cid):
+            self.buckets.pop(cid, None)
+
+        async def acquire_slot(self):
+            while True:
+                now = time.monotonic()
+                wait = max(self.global_until, self.next_slot) - now
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            rate = get_setting("send_rate_per_second")
+            self.next_slot = now + (1.0 / rate if rate > 0 else 0)
+
+        def observe(self, bucket, err):
+            if not isinstance(err, dict) or err.get("type") != "cooldown":
+                return
+            try:
+                retry_seconds = float(err.get("retry_after", 0))
+            except (TypeError, ValueError):
+                return
+
+            until = time.monotonic() + retry_seconds
+            if err.get("global"):
+                self.global_until = max(self.global_until, until)
+            else:
+                bucket.blocked_until = max(bucket.blocked_until, until)
+
+        async def send(self, cid, msg):
+            bucket = self.bucket(cid)
+            async with bucket.lock:
+                delay = bucket.blocked_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                rejected = preflight.check(cid, msg)
+                if rejected:
+                    metrics.inc("sends_skipped_total", reason=classify_error(rejected))
+                    return False, rejected
+
+                channel = store.channel(cid)
+                wait = reconcile_cooldown(channel) if channel is not None else 0
+                if wait > 0:
+                    metrics.inc("sends_skipped_total", reason="slowmode")
+                    err = {"type": "cooldown", "retry_after": wait, "status": None,
+                           "code": SLOWMODE_ERROR_CODE, "global": False, "skipped": True}
+                    self.observe(bucket, err)
+                    return False, err
+
+                await self.acquire_slot()
+                with profiler.phase("send_to"):
+                    ok, err = await send_to(cid, msg)
+                self.observe(bucket, err)
+            return ok, err
+
+        async def run(self, items, handler):
+            items = list(items)
+            if not items:
+                return
+            pending = iter(items)
+
+            async def worker():
+                for item in pending:
+                    await handler(item)
+
+            workers = max(1, min(get_setting("max_concurrent_sends"), len(items)))
+            await asyncio.gather(*(worker() for _ in range(workers)))
+
+    dispatcher = SendDispatcher()
 
     async def send_test_format():
         print("Sending test format...", type_="INFO")
         try:
-            d = load_data()
+            d = store.get()
             if not d["trade_offers"] or not d["trade_requests"]:
                 print("Configure trade first", type_="WARNING")
                 return
 
             server_id = None
             if d["trade_channels"]:
-                server_id = d["trade_channels"][0].get("server_id")
+                server_id = d["trade_channels"][0].server_id
 
             if not server_id:
                 server_id = "0"
 
-            msg = await build_msg(server_id, d["trade_offers"], d["trade_requests"])
+            msg = await build_msg(server_id, d["trade_offers"], d["trade_requests"], template=template_for(server_id))
             ok, err = await send_to("1390328683494903978", msg)
 
             if ok:
@@ -616,61 +2204,34 @@ def blox_fruits_trader():
     
     async def sendNowToChannel(cid):
         try:
-            d = load_data()
+            d = store.get()
             
             if not d["trade_offers"] or not d["trade_requests"]:
                 print("Configure trade first", type_="WARNING")
                 return
             
-            channel = None
-            for tc in d["trade_channels"]:
-                if tc["id"] == cid:
-                    channel = tc
-                    break
-            
+            channel = store.channel(cid)
             if not channel:
                 print("Channel not found", type_="ERROR")
                 return
+
+            if channel.health == "quarantined":
+                preflight.invalidate(channel.id)
+                print(f"Rechecking quarantined channel {channel.channel_name}", type_="INFO")
             
-            msg = await build_msg(channel["server_id"], d["trade_offers"], d["trade_requests"], channel.get("trade_emoji"))
-            ok, err = await send_to(channel["id"], msg)
-            
+            msg = await build_msg(channel.server_id, d["trade_offers"], d["trade_requests"], channel.trade_emoji,
+                                  template_for(channel.server_id, channel.id))
+            ok, err = await dispatcher.send(channel.id, msg)
+            retry_seconds = apply_send_result(channel, ok, err)
+            store.flush()
+            table_refresher.tick()
+
             if ok:
-                now = datetime.now()
-                channel["last_sent"] = now.isoformat()
-                channel["cooldown_until"] = None
-                save_data(d)
-                print(f"✓ Sent to {channel['channel_name']}", type_="SUCCESS")
-
-                row = build_channel_row(channel)
-                if row:
-                    ch_table.update_rows([row])
+                print(f"✓ Sent to {channel.channel_name}", type_="SUCCESS")
+            elif retry_seconds > 0:
+                print(f"⌛ {channel.channel_name}: retry in {int(retry_seconds)}s", type_="WARNING")
             else:
-                if isinstance(err, dict) and err.get("type") == "cooldown":
-                    try:
-                        retry_seconds = float(err.get("retry_after", 0))
-                    except (TypeError, ValueError):
-                        retry_seconds = 0
-
-                    if retry_seconds > 0:
-                        next_time = datetime.now() + timedelta(seconds=retry_seconds)
-                        channel["cooldown_until"] = next_time.isoformat()
-                        save_data(d)
-
-                        row = build_channel_row(channel)
-                        if row:
-                            ch_table.update_rows([row])
-
-                        print(f"⌛ {channel['channel_name']}: retry in {int(retry_seconds)}s", type_="WARNING")
-                        return
-
-                try:
-                    cooldown_val = int(channel.get("cooldown", 60))
-                except:
-                    cooldown_val = 60
-                channel["cooldown_until"] = (datetime.now() + timedelta(seconds=cooldown_val)).isoformat()
-                save_data(d)
-                print(f"✗ {channel['channel_name']}: {describe_error(err)}", type_="ERROR")
+                print(f"✗ {channel.channel_name}: {describe_error(err)}", type_="ERROR")
 
         except Exception as e:
             print(f"Send error: {e}", type_="ERROR")
@@ -680,21 +2241,119 @@ def blox_fruits_trader():
     
     def removeChannel(cid):
         try:
-            d = load_data()
-            before = len(d["trade_channels"])
-            d["trade_channels"] = [tc for tc in d["trade_channels"] if tc["id"] != cid]
-            removed = before - len(d["trade_channels"])
+            removed = store.remove_channel(cid)
 
             if removed <= 0:
                 print(f"Channel {cid} not found", type_="WARNING")
                 return
 
-            save_data(d)
-            ch_table.delete_rows([cid])
+            store.save()
+            scheduler.discard(cid)
+            dispatcher.forget(cid)
+            table_refresher.remove(cid)
+            table_refresher.tick()
             print(f"Removed channel {cid}", type_="SUCCESS")
         except Exception as e:
             print(f"Remove error: {e}", type_="ERROR")
 
+    class TableRefresher:
+        """Coalesces channel-table changes into one batched push per tick."""
+
+        def __init__(self):
+            self.pushed = {}
+            self.changed = set()
+            self.expiry = {}
+            self.heap = []
+            self.inserts = {}
+            self.deletes = set()
+            self.task = None
+
+        def seed(self, rows):
+            for row in rows:
+                self.pushed[row["id"]] = row
+                self.track_countdown(store.channel(row["id"]))
+
+        def track_countdown(self, channel):
+            # Lazy heap like CooldownScheduler: an entry is live only while it matches self.expiry.
+            if channel is None or channel.health == "quarantined" or channel.remaining() <= 0:
+                if channel is not None:
+                    self.expiry.pop(channel.id, None)
+                return
+            deadline = channel.deadline()
+            if self.expiry.get(channel.id) != deadline:
+                self.expiry[channel.id] = deadline
+                heapq.heappush(self.heap, (deadline, channel.id))
+
+        def expired(self, now):
+            due = set()
+            while self.heap and self.heap[0][0] <= now:
+                deadline, cid = heapq.heappop(self.heap)
+                if self.expiry.get(cid) == deadline:
+                    del self.expiry[cid]
+                    due.add(cid)
+            return due
+
+        def mark(self, cid):
+            self.changed.add(cid)
+
+        def insert(self, channel):
+            row = build_channel_row(channel)
+            if row:
+                self.deletes.discard(row["id"])
+                self.inserts[row["id"]] = row
+
+        def remove(self, cid):
+            self.changed.discard(cid)
+            self.expiry.pop(cid, None)
+            if self.inserts.pop(cid, None) is None and cid in self.pushed:
+                self.deletes.add(cid)
+            self.pushed.pop(cid, None)
+
+        def tick(self):
+            with profiler.phase("table_refresh"):
+                self.push()
+
+        def push(self):
+            if self.deletes:
+                ch_table.delete_rows(list(self.deletes))
+                self.deletes = set()
+
+            if self.inserts:
+                rows = list(self.inserts.values())
+                self.inserts = {}
+                ch_table.insert_rows(rows)
+                for row in rows:
+                    self.pushed[row["id"]] = row
+                    self.changed.discard(row["id"])
+                    self.track_countdown(store.channel(row["id"]))
+
+            dirty = self.changed | self.expired(time.monotonic())
+            self.changed = set()
+            updates = []
+            for cid in dirty:
+                channel = store.channel(cid)
+                row = build_channel_row(channel) if channel else None
+                if row is None:
+                    self.expiry.pop(cid, None)
+                    continue
+                self.track_countdown(channel)
+                if row != self.pushed.get(cid):
+                    self.pushed[cid] = row
+                    updates.append(row)
+
+            if updates:
+                ch_table.update_rows(updates)
+
+        async def run(self):
+            while True:
+                await asyncio.sleep(max(0.5, get_setting("table_refresh_interval")))
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"Table refresh error: {e}", type_="ERROR")
+
+    table_refresher = TableRefresher()
+
     initial_channel_rows = []
     for channel in data.get("trade_channels", []):
         row = build_channel_row(channel)
@@ -713,70 +2372,172 @@ def blox_fruits_trader():
             ]}
         ], rows=initial_channel_rows
     )
+    table_refresher.seed(initial_channel_rows)
+
+    class ChannelMatcher:
+        """One rule set compiled into an include regex and an anchored exclude regex."""
+
+        def __init__(self, rules):
+            self.disabled = bool(rules.get("disabled"))
+
+            include = [re.escape(str(k).lower()) for k in rules.get("include") or [] if str(k).strip()]
+            for pattern in rules.get("patterns") or []:
+                # Checked as part of the alternation: inline flags such as (?i) only compile at the start.
+                try:
+                    re.compile("|".join(include + [f"(?:{pattern})"]))
+                except (re.error, TypeError):
+                    print(f"Ignoring invalid channel pattern: {pattern}", type_="WARNING")
+                    continue
+                include.append(f"(?:{pattern})")
+            # Names are compared lowercased; user patterns may be written in any case.
+            self.include = re.compile("|".join(include), re.IGNORECASE) if include else None
+
+            exclude = [re.escape(str(e).lower()) for e in rules.get("exclude_prefixes") or [] if str(e).strip()]
+            self.exclude = re.compile("|".join(exclude)) if exclude else None
+
+        def matches(self, name):
+            if self.disabled or self.include is None:
+                return False
+            n = name.lower()
+            if self.exclude is not None and self.exclude.match(n):
+                return False
+            return self.include.search(n) is not None
+
+    class ChannelRules:
+        """Compiled channel_rules plus a per-channel verdict cache."""
+
+        def __init__(self):
+            self.version = None
+            self.revision = 0
+            self.default = None
+            self.guild_rules = {}
+            self.matchers = {}
+            self.verdicts = {}
+
+        def refresh(self):
+            version = (store.generation, self.revision)
+            if version == self.version:
+                return
+            rules = get_setting("channel_rules")
+            self.default = ChannelMatcher(rules)
+            guilds = rules.get("guilds")
+            self.guild_rules = guilds if isinstance(guilds, dict) else {}
+            self.matchers = {}
+            self.verdicts = {}
+            self.version = version
+
+        def matcher(self, gid):
+            gs = str(gid)
+            matcher = self.matchers.get(gs)
+            if matcher is None:
+                override = self.guild_rules.get(gs)
+                if isinstance(override, dict):
+                    merged = dict(get_setting("channel_rules"))
+                    merged.update(override)
+                    matcher = ChannelMatcher(merged)
+                else:
+                    matcher = self.default
+                self.matchers[gs] = matcher
+            return matcher
+
+        def classify(self, ch):
+            self.refresh()
+            cached = self.verdicts.get(ch.id)
+            if cached is not None and cached[0] == ch.name:
+                return cached[1]
+            verdict = self.matcher(ch.guild.id).matches(ch.name)
+            self.verdicts[ch.id] = (ch.name, verdict)
+            return verdict
+
+        def invalidate(self):
+            self.revision += 1
+
+    channel_rules = ChannelRules()
+
+    def is_trade_channel(ch):
+        return channel_rules.classify(ch)
+
+    def upsert_detected_channel(g, ch, trade_emoji):
+        """Adds or refreshes one detected channel. Returns (entry, added)."""
+        cid = str(ch.id)
+        # Determine slowmode-based cooldown; default to 60 only when off/None
+        try:
+            sd = getattr(ch, 'slowmode_delay', None)
+        except Exception:
+            sd = None
+        cooldown = int(sd) if sd else 60
+        slowmode = int(sd) if sd is not None else None
+
+        existing = store.channel(cid)
+        if existing:
+            # Seeing the channel again is a chance to probe a quarantined entry.
+            if existing.recheck():
+                scheduler.track(existing)
+            # Refresh cooldown and metadata so auto-send respects actual timing
+            existing.slowmode = slowmode
+            if existing.cooldown != cooldown:
+                existing.cooldown = cooldown
+                scheduler.track(existing)
+            existing.server_id = str(g.id)
+            existing.server_name = g.name
+            existing.server_icon = str(g.icon.url) if g.icon else ""
+            existing.channel_name = ch.name
+            if trade_emoji:
+                existing.trade_emoji = trade_emoji
+            return existing, False
+
+        # New entry with actual cooldown
+        entry = store.add_channel(TradeChannel(
+            cid,
+            str(g.id),
+            server_name=g.name,
+            server_icon=str(g.icon.url) if g.icon else "",
+            channel_name=ch.name,
+            cooldown=cooldown,
+            slowmode=slowmode,
+            trade_emoji=trade_emoji,
+        ))
+        scheduler.track(entry)
+        return entry, True
+
+    async def scan_guild(g, channels=None):
+        """Detects trade channels in one guild; the trade emoji is resolved once per guild."""
+        added = []
+        updated = []
+        trade_emoji = None
+
+        for ch in (g.text_channels if channels is None else channels):
+            if not is_trade_channel(ch):
+                continue
+            if trade_emoji is None:
+                trade_emoji = await find_trade_emoji(g)
+
+            entry, is_new = upsert_detected_channel(g, ch, trade_emoji)
+            if is_new:
+                print(f"Found: {ch.name} in {g.name}", type_="SUCCESS")
+                table_refresher.insert(entry)
+                added.append(entry)
+            else:
+                table_refresher.mark(entry.id)
+                updated.append(entry)
+
+        return added, updated
 
     async def detect():
         det_btn.loading = True
         det_btn.disabled = True
         try:
-            d = load_data()
+            d = store.get()
             added = 0
-            updated = 0
-            kw = ["trading", "slow-trading", "fast-trading", "trade-chat", "trades", "trade"]
-            ex = ["pvb", "sab"]
             
             print("Scanning servers for trading channels...", type_="INFO")
             
             for g in bot.guilds:
-                for ch in g.text_channels:
-                    n = ch.name.lower()
-                    if any(k in n for k in kw) and not any(n.startswith(e) for e in ex):
-                        cid = str(ch.id)
-                        # Determine slowmode-based cooldown; default to 60 only when off/None
-                        try:
-                            sd = getattr(ch, 'slowmode_delay', None)
-                        except Exception:
-                            sd = None
-                        cooldown = int(sd) if sd else 60
-
-                        trade_emoji = await find_trade_emoji(g)
-
-                        existing = next((tc for tc in d["trade_channels"] if tc["id"] == cid), None)
-                        if existing:
-                            # Refresh cooldown and metadata so auto-send respects actual timing
-                            if existing.get("cooldown") != cooldown:
-                                existing["cooldown"] = cooldown
-                                updated += 1
-                            existing["server_id"] = str(g.id)
-                            existing["server_name"] = g.name
-                            existing["server_icon"] = str(g.icon.url) if g.icon else ""
-                            existing["channel_name"] = ch.name
-                            if trade_emoji:
-                                existing["trade_emoji"] = trade_emoji
-
-                            row = build_channel_row(existing)
-                            if row:
-                                ch_table.update_rows([row])
-                        else:
-                            # New entry with actual cooldown
-                            d["trade_channels"].append({
-                                "id": cid,
-                                "server_id": str(g.id),
-                                "server_name": g.name,
-                                "server_icon": str(g.icon.url) if g.icon else "",
-                                "channel_name": ch.name,
-                                "cooldown": cooldown,
-                                "last_sent": None,
-                                "trade_emoji": trade_emoji,
-                                "cooldown_until": None
-                            })
-
-                            row = build_channel_row(d["trade_channels"][-1])
-                            if row:
-                                ch_table.insert_rows([row])
-                            added += 1
-                            print(f"Found: {ch.name} in {g.name}", type_="SUCCESS")
-            
-            save_data(d)
+                guild_added, _ = await scan_guild(g)
+                added += len(guild_added)
+
+            table_refresher.tick()
+            store.save()
             print(f"✓ Detection complete: Found {added} new trading channels", type_="SUCCESS")
             
             # Enable start button if we have channels and trade configured
@@ -789,6 +2550,20 @@ def blox_fruits_trader():
             det_btn.loading = False
             det_btn.disabled = False
 
+    async def detect_incremental(g, channels=None):
+        try:
+            added, updated = await scan_guild(g, channels)
+            if not added and not updated:
+                return
+            table_refresher.tick()
+            store.save()
+
+            d = store.get()
+            if d["trade_offers"] and d["trade_requests"] and not AutoState.running and not AutoState.batch_running:
+                start_btn.disabled = False
+        except Exception as e:
+            print(f"Detect failed: {e}", type_="ERROR")
+
     async def add():
         add_btn.loading = True
         sid = srv_in.value.strip()
@@ -807,29 +2582,28 @@ def blox_fruits_trader():
                 add_btn.loading = False
                 return
             
-            d = load_data()
+            d = store.get()
+            trade_emoji = await find_trade_emoji(g)
             for cid in [c.strip() for c in cids.split(",")]:
                 ch = bot.get_channel(int(cid))
-                if not ch or any(tc["id"] == cid for tc in d["trade_channels"]):
+                if not ch or store.channel(cid):
                     continue
                 
-                d["trade_channels"].append({
-                    "id": cid,
-                    "server_id": sid,
-                    "server_name": g.name,
-                    "server_icon": str(g.icon.url) if g.icon else "",
-                    "channel_name": ch.name,
-                    "cooldown": cd,
-                    "last_sent": None,
-                    "trade_emoji": await find_trade_emoji(g),
-                    "cooldown_until": None
-                })
+                entry = store.add_channel(TradeChannel(
+                    cid,
+                    sid,
+                    server_name=g.name,
+                    server_icon=str(g.icon.url) if g.icon else "",
+                    channel_name=ch.name,
+                    cooldown=cd,
+                    trade_emoji=trade_emoji,
+                ))
                 
-                row = build_channel_row(d["trade_channels"][-1])
-                if row:
-                    ch_table.insert_rows([row])
+                scheduler.track(entry)
+                table_refresher.insert(entry)
             
-            save_data(d)
+            table_refresher.tick()
+            store.save()
             print(f"Added channels", type_="SUCCESS")
             srv_in.value = ""
             ch_in.value = ""
@@ -844,27 +2618,97 @@ def blox_fruits_trader():
         finally:
             add_btn.loading = False
 
+    def split_rule_input(value):
+        return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+    def split_pattern_input(value):
+        # Regexes may contain commas ({1,3}); Discord channel names can't contain spaces, so patterns are space-separated.
+        return (value or "").split()
+
+    def show_channel_rules():
+        current = get_setting("channel_rules")
+        kw_in.value = ", ".join(current.get("include") or [])
+        exc_in.value = ", ".join(current.get("exclude_prefixes") or [])
+        pat_in.value = " ".join(current.get("patterns") or [])
+
+    def show_message_template():
+        tpl_in.value = get_setting("message_templates").get("default") or DEFAULT_TEMPLATE
+
+    def save_message_template():
+        text = (tpl_in.value or "").strip()
+        if text:
+            try:
+                template_plans[text] = compile_template(text)
+            except ValueError as e:
+                print(f"Invalid template: {e}", type_="ERROR")
+                return
+
+        d = store.get()
+        current = dict(get_setting("message_templates"))
+        cids = [c.strip() for c in (ch_in.value or "").split(",") if c.strip()]
+        sid = (srv_in.value or "").strip()
+
+        if cids:
+            scope, keys = "channels", cids
+        elif sid:
+            scope, keys = "guilds", [sid]
+        else:
+            current["default"] = text or DEFAULT_TEMPLATE
+            scope, keys = None, []
+
+        if scope:
+            overrides = dict(current.get(scope) or {})
+            for key in keys:
+                if text:
+                    overrides[key] = text
+                else:
+                    overrides.pop(key, None)
+            current[scope] = overrides
+
+        d["settings"]["message_templates"] = current
+        store.save()
+        invalidate_rendered()
+        if scope is None:
+            print(f"Saved default message template: {current['default']}", type_="SUCCESS")
+        else:
+            target = f"{len(keys)} {'channel' if scope == 'channels' else 'server'}(s)"
+            print(f"{'Saved' if text else 'Cleared'} message template for {target}", type_="SUCCESS")
+        start_prewarm()
+
+    def save_channel_rules():
+        d = store.get()
+        current = dict(get_setting("channel_rules"))
+        current["include"] = split_rule_input(kw_in.value)
+        current["exclude_prefixes"] = split_rule_input(exc_in.value)
+        current["patterns"] = split_pattern_input(pat_in.value)
+        d["settings"]["channel_rules"] = current
+        store.save()
+        channel_rules.invalidate()
+        print(f"Saved detection rules: {len(current['include'])} keywords, {len(current['exclude_prefixes'])} exclusions, {len(current['patterns'])} patterns", type_="SUCCESS")
+
     def save_trade():
         save_btn.loading = True
-        d = load_data()
+        d = store.get()
         
         offers = parse_trade_input(off_in.value)
         requests = parse_trade_input(req_in.value)
         
         d["trade_offers"] = offers
         d["trade_requests"] = requests
-        save_data(d)
+        store.save()
+        invalidate_rendered()
         
         ex = [r["id"] for r in tr_table.rows]
         if ex:
             tr_table.delete_rows(ex)
         
         if offers:
-            tr_table.insert_rows([{"id": "o", "cells": [{"text": f"Offering: {' '.join(offers)}"}]}])
+            tr_table.insert_rows([{"id": "o", "cells": [{"text": f"Offering: {format_trade_runs(offers)}"}]}])
         if requests:
-            tr_table.insert_rows([{"id": "r", "cells": [{"text": f"Requesting: {' '.join(requests)}"}]}])
+            tr_table.insert_rows([{"id": "r", "cells": [{"text": f"Requesting: {format_trade_runs(requests)}"}]}])
         
-        print(f"Saved: {len(offers)} offers, {len(requests)} requests", type_="SUCCESS")
+        print(f"Saved: {sum(n for _, n in offers)} offers, {sum(n for _, n in requests)} requests", type_="SUCCESS")
+        start_prewarm()
         
         save_btn.loading = False
         
@@ -878,7 +2722,7 @@ def blox_fruits_trader():
         start_btn.disabled = True
         stop_btn.disabled = False
         
-        d = load_data()
+        d = store.get()
         
         if not d["trade_offers"] or not d["trade_requests"]:
             print("Configure trade first", type_="WARNING")
@@ -894,65 +2738,60 @@ def blox_fruits_trader():
             stop_btn.disabled = True
             return
         
-        sent = skip = fail = 0
+        counts = {"sent": 0, "skip": 0, "fail": 0}
         total = len(d["trade_channels"])
+        stopped = []
         
         print(f"Starting batch send to {total} channels...", type_="INFO")
-        
-        for idx, c in enumerate(d["trade_channels"], 1):
+
+        async def process(item):
+            idx, c = item
             if AutoState.should_stop:
-                print(f"⏸ Batch stopped at channel {idx}/{total}: {c['channel_name']}", type_="WARNING")
-                break
-                
+                if not stopped:
+                    stopped.append(idx)
+                    print(f"⏸ Batch stopped at channel {idx}/{total}: {c.channel_name}", type_="WARNING")
+                return
+
             try:
-                rem = get_cooldown_remaining(c)
+                if c.health == "quarantined":
+                    counts["skip"] += 1
+                    print(f"[{idx}/{total}] Skipped {c.channel_name} (quarantined: {c.last_error})", type_="INFO")
+                    return
+
+                rem = c.remaining()
                 if rem > 0:
-                    skip += 1
-                    print(f"[{idx}/{total}] Skipped {c['channel_name']} (cooldown: {rem}s)", type_="INFO")
-                    continue
-                
-                msg = await build_msg(c["server_id"], d["trade_offers"], d["trade_requests"], c.get("trade_emoji"))
-                ok, err = await send_to(c["id"], msg)
-                
+                    counts["skip"] += 1
+                    print(f"[{idx}/{total}] Skipped {c.channel_name} (cooldown: {rem}s)", type_="INFO")
+                    return
+
+                msg = await build_msg(c.server_id, d["trade_offers"], d["trade_requests"], c.trade_emoji,
+                                      template_for(c.server_id, c.id))
+                ok, err = await dispatcher.send(c.id, msg)
+                retry_seconds = apply_send_result(c, ok, err)
+
                 if ok:
-                    sent += 1
-                    now = datetime.now()
-                    c["last_sent"] = now.isoformat()
-                    c["cooldown_until"] = None
-                    print(f"[{idx}/{total}] ✓ {c['channel_name']}", type_="SUCCESS")
+                    counts["sent"] += 1
+                    print(f"[{idx}/{total}] ✓ {c.channel_name}", type_="SUCCESS")
+                elif retry_seconds > 0:
+                    counts["fail"] += 1
+                    print(f"[{idx}/{total}] ⏳ {c.channel_name}: retry in {int(retry_seconds)}s", type_="WARNING")
                 else:
-                    fail += 1
-                    if isinstance(err, dict) and err.get("type") == "cooldown":
-                        try:
-                            retry_seconds = float(err.get("retry_after", 0))
-                        except (TypeError, ValueError):
-                            retry_seconds = 0
-                        if retry_seconds > 0:
-                            next_time = datetime.now() + timedelta(seconds=retry_seconds)
-                            c["cooldown_until"] = next_time.isoformat()
-                            print(f"[{idx}/{total}] ⏳ {c['channel_name']}: retry in {int(retry_seconds)}s", type_="WARNING")
-                        else:
-                            print(f"[{idx}/{total}] ✗ {c['channel_name']}: {describe_error(err)}", type_="ERROR")
-                    else:
-                        try:
-                            cooldown_val = int(c.get("cooldown", 60))
-                        except:
-                            cooldown_val = 60
-                        next_time = datetime.now() + timedelta(seconds=cooldown_val)
-                        c["cooldown_until"] = next_time.isoformat()
-                        print(f"[{idx}/{total}] ✗ {c['channel_name']}: {describe_error(err)}", type_="ERROR")
-
-                await asyncio.sleep(random.uniform(2, 4))
+                    counts["fail"] += 1
+                    print(f"[{idx}/{total}] ✗ {c.channel_name}: {describe_error(err)}", type_="ERROR")
             except Exception as e:
-                fail += 1
-                print(f"[{idx}/{total}] ✗ {c['channel_name']}: {str(e)}", type_="ERROR")
-        
-        save_data(d)
+                counts["fail"] += 1
+                print(f"[{idx}/{total}] ✗ {c.channel_name}: {str(e)}", type_="ERROR")
+
+        with profiler.cycle("send_batch"):
+            await dispatcher.run(enumerate(d["trade_channels"], 1), process)
+            store.flush()
+        profiler.report()
         
+        summary = f"{counts['sent']} sent, {counts['skip']} skipped, {counts['fail']} failed"
         if AutoState.should_stop:
-            print(f"Batch stopped: {sent} sent, {skip} skipped, {fail} failed", type_="WARNING")
+            print(f"Batch stopped: {summary}", type_="WARNING")
         else:
-            print(f"Batch complete: {sent} sent, {skip} skipped, {fail} failed", type_="SUCCESS")
+            print(f"Batch complete: {summary}", type_="SUCCESS")
         
         AutoState.batch_running = False
         AutoState.should_stop = False
@@ -961,114 +2800,92 @@ def blox_fruits_trader():
     async def auto_loop():
         print("Auto-send loop startedV3", type_="SUCCESS")
 
-        error_log = []
-
-        while AutoState.running:
-            try:
-                d = load_data()
+        event_log.reset()
 
-                if not d["trade_offers"] or not d["trade_requests"] or not d["trade_channels"]:
-                    await asyncio.sleep(5)
-                    continue
+        async def process(cid):
+            c = store.channel(cid)
+            if c is None:
+                return
 
-                sent_this_loop = 0
+            if not AutoState.running or c.health == "quarantined":
+                scheduler.track(c)
+                return
 
-                channels_with_cooldowns = []
-                for c in d["trade_channels"]:
-                    rem = get_cooldown_remaining(c)
-                    channels_with_cooldowns.append((rem, c))
+            # The deadline may have moved since it was queued (edited file, manual send).
+            if c.deadline() > time.monotonic():
+                scheduler.track(c)
+                return
 
-                channels_with_cooldowns.sort(key=lambda x: x[0])
+            try:
+                d = store.get()
+                msg = await build_msg(c.server_id, d["trade_offers"], d["trade_requests"], c.trade_emoji,
+                                      template_for(c.server_id, c.id))
+                ok, err = await dispatcher.send(c.id, msg)
+                retry_seconds = apply_send_result(c, ok, err)
 
-                for rem, c in channels_with_cooldowns:
-                    if not AutoState.running:
-                        break
+                if ok:
+                    print(f"✓ Auto: {c.channel_name}", type_="SUCCESS")
+                    return
 
-                    if rem <= 0:
-                        try:
-                            msg = await build_msg(c["server_id"], d["trade_offers"], d["trade_requests"], c.get("trade_emoji"))
-                            ok, err = await send_to(c["id"], msg)
-
-                            if ok:
-                                now = datetime.now()
-                                c["last_sent"] = now.isoformat()
-                                c["cooldown_until"] = None
-                                sent_this_loop += 1
-                                print(f"✓ Auto: {c['channel_name']}", type_="SUCCESS")
-                            else:
-                                message = describe_error(err)
-                                if isinstance(err, dict) and err.get("type") == "cooldown":
-                                    try:
-                                        retry_seconds = float(err.get("retry_after", 0))
-                                    except (TypeError, ValueError):
-                                        retry_seconds = 0
-
-                                    if retry_seconds > 0:
-                                        next_time = datetime.now() + timedelta(seconds=retry_seconds)
-                                        c["cooldown_until"] = next_time.isoformat()
-                                        print(f"⌛ Auto: {c['channel_name']} retry in {int(retry_seconds)}s", type_="WARNING")
-                                    else:
-                                        print(f"✗ Auto: {c['channel_name']}: {message}", type_="ERROR")
-                                else:
-                                    try:
-                                        cooldown_val = int(c.get("cooldown", 60))
-                                    except:
-                                        cooldown_val = 60
-                                    next_time = datetime.now() + timedelta(seconds=cooldown_val)
-                                    c["cooldown_until"] = next_time.isoformat()
-                                    print(f"✗ Auto: {c['channel_name']}: {message}", type_="ERROR")
-
-                                error_log.append(f"{c['channel_name']}: {message}")
-
-                            await asyncio.sleep(random.uniform(2, 4))
-                        except Exception as e:
-                            try:
-                                cooldown_val = int(c.get("cooldown", 60))
-                            except:
-                                cooldown_val = 60
-                            next_time = datetime.now() + timedelta(seconds=cooldown_val)
-                            c["cooldown_until"] = next_time.isoformat()
-                            print(f"✗ Auto: {c['channel_name']}: {str(e)}", type_="ERROR")
-                            error_log.append(f"{c['channel_name']}: {str(e)}")
-
-                save_data(d)
-
-                min_wait = float('inf')
-                for rem, _ in channels_with_cooldowns:
-                    if rem < min_wait:
-                        min_wait = rem
-
-                if sent_this_loop > 0:
-                    wait_time = 1
-                elif min_wait != float('inf') and min_wait > 0:
-                    wait_time = min(min_wait, 10)
+                if retry_seconds > 0:
+                    print(f"⌛ Auto: {c.channel_name} retry in {int(retry_seconds)}s", type_="WARNING")
                 else:
-                    wait_time = 5
+                    print(f"✗ Auto: {c.channel_name}: {describe_error(err)}", type_="ERROR")
+                event_log.record(c, err)
+            except Exception as e:
+                apply_send_result(c, False, str(e))
+                print(f"✗ Auto: {c.channel_name}: {str(e)}", type_="ERROR")
+                event_log.record(c, e)
 
-                await asyncio.sleep(wait_time)
+        scheduler.reset(store.get()["trade_channels"])
+        generation = store.generation
 
-            except Exception as e:
-                print(f"Auto-loop error: {str(e)}", type_="ERROR")
-                await asyncio.sleep(10)
-
-        # Print all errors when stopped
-        if error_log:
-            print(f"\n=== Auto-send Error Summary ({len(error_log)} errors) ===", type_="WARNING")
-            # Group errors by type
-            error_counts = {}
-            for err in error_log:
-                if err not in error_counts:
-                    error_counts[err] = 1
-                else:
-                    error_counts[err] += 1
+        try:
+            while AutoState.running:
+                try:
+                    await scheduler.wait()
+                    if not AutoState.running:
+                        break
 
-            for err, count in error_counts.items():
-                print(f"  [{count}x] {err}", type_="ERROR")
+                    d = store.get()
+                    if store.generation != generation:
+                        # The file was edited outside the script; re-key every channel from it.
+                        generation = store.generation
+                        scheduler.reset(d["trade_channels"])
+                        continue
+
+                    if not d["trade_offers"] or not d["trade_requests"] or not d["trade_channels"]:
+                        await asyncio.sleep(5)
+                        continue
+
+                    metrics.inc("scheduler_wakeups_total")
+                    due = scheduler.pop_due(time.monotonic())
+                    if not due:
+                        continue
+
+                    metrics.inc("scheduler_due_total", len(due))
+                    started = time.perf_counter()
+                    with profiler.cycle("auto_cycle"):
+                        try:
+                            await dispatcher.run(due, process)
+                        finally:
+                            # Also on cancel (Stop): the sends already made must reach disk.
+                            store.flush()
+                    metrics.observe("scheduler_cycle_seconds", time.perf_counter() - started)
+
+                except Exception as e:
+                    print(f"Auto-loop error: {str(e)}", type_="ERROR")
+                    await asyncio.sleep(10)
+        finally:
+            # Print all errors when stopped, including when Stop cancels the task mid-cycle
+            if event_log.counts:
+                event_log.print_summary()
+            profiler.report()
 
         print("Auto-send loop stopped", type_="INFO")
 
     def start_operation():
-        d = load_data()
+        d = store.get()
         
         if not d["trade_offers"] or not d["trade_requests"]:
             print("Configure trade first", type_="WARNING")
@@ -1089,6 +2906,9 @@ def blox_fruits_trader():
             bot.loop.create_task(send_batch())
 
     def stop_operation():
+        store.flush()
+        bot.loop.create_task(data_writer.flush())
+        bot.loop.create_task(emoji_cache_writer.flush())
         if auto_check.checked:
             # Stop auto-send loop
             if AutoState.running:
@@ -1104,7 +2924,92 @@ def blox_fruits_trader():
                 AutoState.should_stop = True
                 print("Stopping batch send...", type_="WARNING")
 
+    def recheck_quarantined(guild_id, channel_id=None):
+        """Releases quarantined channels in a guild (or one channel) for a probe send."""
+        gs = str(guild_id)
+        released = 0
+        for c in store.get()["trade_channels"]:
+            if c.server_id != gs or (channel_id is not None and c.id != str(channel_id)):
+                continue
+            if c.recheck():
+                preflight.invalidate(c.id)
+                scheduler.track(c)
+                table_refresher.mark(c.id)
+                store.save_channel(c)
+                released += 1
+        if released:
+            store.flush()
+            print(f"Rechecking {released} quarantined channel(s)", type_="INFO")
+        return released
+
     # Event Handlers
+    @bot.listen("on_guild_emojis_update")
+    async def on_guild_emojis_update(guild, before, after):
+        forget_guild_emojis(guild.id)
+
+    @bot.listen("on_guild_remove")
+    async def on_guild_remove(guild):
+        forget_guild_emojis(guild.id)
+        preflight.invalidate_guild(guild.id)
+
+    @bot.listen("on_guild_available")
+    async def on_guild_available(guild):
+        # Back after an outage or reconnect: channels that went missing meanwhile get a probe send.
+        preflight.invalidate_guild(guild.id)
+        recheck_quarantined(guild.id)
+
+    @bot.listen("on_guild_join")
+    async def on_guild_join(guild):
+        preflight.invalidate_guild(guild.id)
+        await detect_incremental(guild)
+
+    @bot.listen("on_guild_update")
+    async def on_guild_update(before, after):
+        preflight.invalidate_guild(after.id)
+
+    @bot.listen("on_guild_channel_delete")
+    async def on_guild_channel_delete(channel):
+        preflight.invalidate(channel.id)
+
+    @bot.listen("on_guild_channel_create")
+    async def on_guild_channel_create(channel):
+        # Events cover every channel kind; Detect only ever looks at guild.text_channels (text and news).
+        if isinstance(channel, discord.TextChannel):
+            await detect_incremental(channel.guild, [channel])
+
+    @bot.listen("on_guild_channel_update")
+    async def on_guild_channel_update(before, after):
+        preflight.invalidate(after.id)
+        if not isinstance(after, discord.TextChannel):
+            return
+        if before.name != after.name or getattr(before, "slowmode_delay", None) != getattr(after, "slowmode_delay", None):
+            await detect_incremental(after.guild, [after])
+        else:
+            # Permission overwrites may have changed.
+            recheck_quarantined(after.guild.id, after.id)
+
+    @bot.listen("on_guild_role_update")
+    async def on_guild_role_update(before, after):
+        preflight.invalidate_guild(after.guild.id)
+        recheck_quarantined(after.guild.id)
+
+    @bot.listen("on_guild_role_delete")
+    async def on_guild_role_delete(role):
+        preflight.invalidate_guild(role.guild.id)
+        recheck_quarantined(role.guild.id)
+
+    @bot.listen("on_member_update")
+    async def on_member_update(before, after):
+        if bot.user is not None and after.id == bot.user.id and getattr(before, "roles", None) != getattr(after, "roles", None):
+            preflight.invalidate_guild(after.guild.id)
+            recheck_quarantined(after.guild.id)
+
+    def on_profiling_change(checked):
+        d = store.get()
+        d["settings"]["profiling"] = bool(checked)
+        store.save()
+        profiler.set_enabled(bool(checked))
+
     def on_srv_input(v):
         add_btn.disabled = not (v and ch_in.value and v.isdigit() and len(v) >= 17)
     
@@ -1125,35 +3030,92 @@ def blox_fruits_trader():
     add_btn.onClick = lambda: bot.loop.create_task(add())
     det_btn.onClick = lambda: bot.loop.create_task(detect())
     save_btn.onClick = save_trade
+    rules_btn.onClick = save_channel_rules
+    tpl_btn.onClick = save_message_template
     start_btn.onClick = start_operation
     stop_btn.onClick = stop_operation
     test_btn.onClick = lambda: bot.loop.create_task(send_test_format())
+    log_btn.onClick = event_log.print_summary
+    prof_check.onChange = on_profiling_change
 
     # Initialization
+    class Prewarm:
+        task = None
+
+    async def prewarm_emojis():
+        """Resolves trade/or emojis and every trade token for each configured guild, off the send path."""
+        d = store.get()
+        guild_ids = list(dict.fromkeys(c.server_id for c in d["trade_channels"]))
+        if not guild_ids:
+            return
+
+        offers, requests = d["trade_offers"], d["trade_requests"]
+        tokens = list(dict.fromkeys(item for item, _ in (*offers, *requests) if item not in SEPARATOR_TOKENS))
+        layouts = {}
+        for c in d["trade_channels"]:
+            layouts.setdefault(c.server_id, set()).add((c.trade_emoji, template_for(c.server_id, c.id)))
+
+        total = len(guild_ids)
+        step = max(10, total // 10)
+        warmed = 0
+        started = time.perf_counter()
+        print(f"Prewarming emojis for {total} servers...", type_="INFO")
+
+        for n, gid in enumerate(guild_ids, 1):
+            g = bot.get_guild(int(gid))
+            if g is not None:
+                try:
+                    await guild_special_emoji(g, "trade")
+                    await guild_special_emoji(g, "or")
+                    for token in tokens:
+                        await fetch_emoji(gid, token)
+                    if offers and requests:
+                        for te, template in layouts[gid]:
+                            await build_msg(gid, offers, requests, te, template)
+                    warmed += 1
+                except Exception as e:
+                    print(f"Prewarm failed for {g.name}: {e}", type_="WARNING")
+
+            if n % step == 0 and n < total:
+                print(f"Prewarm: {n}/{total} servers", type_="INFO")
+            # Let sends and UI work run between guilds.
+            await asyncio.sleep(0)
+
+        print(f"Emoji prewarm complete: {warmed}/{total} servers in {time.perf_counter() - started:.1f}s", type_="SUCCESS")
+
+    def start_prewarm():
+        if Prewarm.task is not None and not Prewarm.task.done():
+            Prewarm.task.cancel()
+        Prewarm.task = bot.loop.create_task(prewarm_emojis())
+
     async def init():
-        d = load_data()
+        d = store.get()
         
         if not getattr(ch_table, "rows", None):
             for c in d["trade_channels"]:
                 try:
-                    row = build_channel_row(c)
-                    if row:
-                        ch_table.insert_rows([row])
+                    table_refresher.insert(c)
                 except:
                     pass
+            table_refresher.tick()
+        table_refresher.task = bot.loop.create_task(table_refresher.run())
+        metrics.task = bot.loop.create_task(metrics.run())
         
         if d.get("trade_offers") and d.get("trade_requests"):
-            off_in.value = " ".join(d["trade_offers"])
-            req_in.value = " ".join(d["trade_requests"])
+            off_in.value = format_trade_runs(d["trade_offers"])
+            req_in.value = format_trade_runs(d["trade_requests"])
 
-            tr_table.insert_rows([{"id": "o", "cells": [{"text": f"Offering: {' '.join(d['trade_offers'])}"}]}])
-            tr_table.insert_rows([{"id": "r", "cells": [{"text": f"Requesting: {' '.join(d['trade_requests'])}"}]}])
+            tr_table.insert_rows([{"id": "o", "cells": [{"text": f"Offering: {off_in.value}"}]}])
+            tr_table.insert_rows([{"id": "r", "cells": [{"text": f"Requesting: {req_in.value}"}]}])
             
             # Enable start button if we have channels
             if d["trade_channels"]:
                 start_btn.disabled = False
         
+        show_channel_rules()
+        show_message_template()
         print(f"Loaded {len(d['trade_channels'])} channels", type_="SUCCESS")
+        start_prewarm()
 
     bot.loop.create_task(init())
     tab.render()